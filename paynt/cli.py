@@ -1,15 +1,22 @@
 from . import version
 
 from .parser.sketch import Sketch
+from .quotient.holes import DesignSpace
+from .quotient.smt import SmtSolver
+from .quotient.quotient import QuotientContainer
 from .quotient.quotient_pomdp import POMDPQuotientContainer
+from .quotient.models import MarkovChain
 
 from .synthesizer.synthesizer import Synthesizer
 from .synthesizer.synthesizer_onebyone import SynthesizerOneByOne
 from .synthesizer.synthesizer_ar import SynthesizerAR
 from .synthesizer.synthesizer_cegis import SynthesizerCEGIS
-from .synthesizer.synthesizer_hybrid import SynthesizerHybrid
+from .synthesizer.synthesizer_hybrid import SynthesizerHybrid, StageControl
 from .synthesizer.synthesizer_pomdp import SynthesizerPOMDP
 from .synthesizer.synthesizer_multicore_ar import SynthesizerMultiCoreAR
+from .synthesizer.synthesizer_distributed_ar import SynthesizerDistributedAR, run_worker, parse_address, is_loopback
+from .synthesizer.frontier import SpillingFrontier
+from .synthesizer.checkpoint import Checkpoint
 
 from .quotient.storm_pomdp_control import StormPOMDPControl
 
@@ -72,13 +79,49 @@ def setup_logger(log_path = None):
     help="export the model to *.drn/*.pomdp and abort")
 
 @click.option("--method",
-    type=click.Choice(['onebyone', 'ar', 'cegis', 'hybrid', 'ar_multicore']),
+    type=click.Choice(['onebyone', 'ar', 'cegis', 'hybrid', 'ar_multicore', 'ar_distributed']),
     default="ar", show_default=True,
     help="synthesis method"
     )
 
 @click.option("--incomplete-search", is_flag=True, default=False,
     help="use incomplete search during synthesis")
+@click.option("--incremental-build", is_flag=True, default=False,
+    help="build MDPs of subfamilies by restricting the MDP of the parent family (uses more memory)")
+@click.option("--model-cache", type=click.INT, default=None,
+    help="memory budget (in MB) for caching restricted quotient models, 0 disables caching (default: 64 for cegis/hybrid, where assignments recur, 0 otherwise)")
+@click.option("--warm-start", is_flag=True, default=False,
+    help="seed MDP model checking of subfamilies with the values of the parent family")
+@click.option("--count-iterations", is_flag=True, default=False,
+    help="report the number of solver iterations of MDP model checking (parsed from the storm log, slower)")
+@click.option("--frontier",
+    type=click.Choice(['dfs', 'bfs', 'best', 'hybrid']),
+    default="dfs", show_default=True,
+    help="order in which AR explores families")
+@click.option("--frontier-key",
+    type=click.Choice(['value', 'gap', 'size']),
+    default="value", show_default=True,
+    help="priority of families for best-first (hybrid) exploration")
+@click.option("--frontier-window", type=click.INT, default=0, show_default=True,
+    help="maximum number of pending AR families kept in memory (dfs/bfs only), the rest is spilled to disk; 0 disables spilling")
+@click.option("--start-method", type=click.Choice(["fork","spawn","forkserver"]), default=None,
+    help="start method of the worker processes of ar_multicore (default: platform default)")
+@click.option("--coordinator", default="localhost:0", show_default=True,
+    help="host:port the coordinator of ar_distributed listens at (port 0 picks a free port), or the worker connects to")
+@click.option("--local-workers", type=click.INT, default=0, show_default=True,
+    help="number of ar_distributed worker processes started by the coordinator on this machine")
+@click.option("--worker", is_flag=True, default=False,
+    help="run as a worker of the ar_distributed coordinator at --coordinator")
+@click.option("--authkey", default=None,
+    help="key authenticating ar_distributed workers, required unless --coordinator is a loopback address")
+@click.option("--worker-timeout", type=click.FLOAT, default=60, show_default=True,
+    help="time (in seconds) the ar_distributed coordinator waits for a worker to connect and to load the sketch")
+@click.option("--checkpoint", type=click.Path(), default=None,
+    help="journal file for checkpoints of AR/CEGIS/hybrid synthesis (not supported for --fsc-synthesis)")
+@click.option("--checkpoint-period", type=click.FLOAT, default=60, show_default=True,
+    help="period (in seconds) of writing checkpoints")
+@click.option("--resume", is_flag=True, default=False,
+    help="resume synthesis from the checkpoint journal")
 
 @click.option("--fsc-synthesis", is_flag=True, default=False,
     help="enable incremental synthesis of FSCs for a POMDP")
@@ -122,6 +165,12 @@ def setup_logger(log_path = None):
     show_default=True,
     help="counterexample generator",
 )
+@click.option("--smt-backend", type=click.Choice(["z3", "cvc5", "native"]), default=None,
+    help="backend enumerating CEGIS assignments (default: CVC5 if installed, Z3 if installed, native otherwise)")
+@click.option("--cegis-batch", type=click.IntRange(min=1), default=1, show_default=True,
+    help="number of distinct CEGIS assignments analyzed in parallel in each round")
+@click.option("--stage-window", type=click.FLOAT, default=10, show_default=True,
+    help="window (in seconds) over which hybrid synthesis measures the pruning throughput of AR and CEGIS")
 @click.option("--pomcp", is_flag=True, default=False,
     help="run POMCP")
 @click.option("--profiling", is_flag=True, default=False,
@@ -131,12 +180,15 @@ def paynt(
         project, sketch, props, constants, relative_error,
         filetype, export,
         method,
-        incomplete_search,
+        incomplete_search, incremental_build, model_cache, warm_start, count_iterations,
+        frontier, frontier_key, frontier_window, start_method,
+        coordinator, local_workers, worker, authkey, worker_timeout,
+        checkpoint, checkpoint_period, resume,
         fsc_synthesis, pomdp_memory_size, posterior_aware,
         fsc_export_result,
         storm_pomdp, iterative_storm, get_storm_result, storm_options, prune_storm,
         use_storm_cutoffs, unfold_strategy_storm,
-        ce_generator,
+        ce_generator, smt_backend, cegis_batch, stage_window,
         pomcp,
         profiling
 ):
@@ -144,7 +196,39 @@ def paynt(
 
     # set CLI parameters
     Synthesizer.incomplete_search = incomplete_search
+    QuotientContainer.build_incrementally = incremental_build
+    if model_cache is None:
+        model_cache = 64 if method in ["cegis", "hybrid"] else 0
+    QuotientContainer.model_cache_budget = model_cache * 1024**2
+    DesignSpace.store_hints = warm_start
+    MarkovChain.count_iterations = count_iterations
+    SynthesizerAR.frontier_type = frontier
+    SynthesizerAR.frontier_key = frontier_key
+    SpillingFrontier.window_size = frontier_window
+    SynthesizerMultiCoreAR.start_method = start_method
+    SynthesizerDistributedAR.address = parse_address(coordinator)
+    SynthesizerDistributedAR.local_workers = local_workers
+    if authkey is None:
+        if not is_loopback(SynthesizerDistributedAR.address[0]):
+            raise ValueError("an explicit --authkey is required when --coordinator is not a loopback address")
+        authkey = "paynt"
+    SynthesizerDistributedAR.authkey = authkey.encode()
+    SynthesizerDistributedAR.worker_timeout = worker_timeout
+    Checkpoint.path = checkpoint
+    Checkpoint.period = checkpoint_period
+    Checkpoint.resume = resume
+    if resume and checkpoint is None:
+        raise ValueError("--resume requires a checkpoint journal (--checkpoint)")
+    if checkpoint is not None:
+        # the journal describes the exploration of a single design space by a single synthesizer
+        if method not in ["ar", "cegis", "hybrid"]:
+            raise ValueError(f"checkpoints (--checkpoint) are not supported by the {method} method")
+        if fsc_synthesis or pomcp or storm_pomdp:
+            raise ValueError("checkpoints (--checkpoint) are not supported by the POMDP synthesis loops")
     SynthesizerCEGIS.conflict_generator_type = ce_generator
+    SynthesizerCEGIS.batch_size = cegis_batch
+    StageControl.window = stage_window
+    SmtSolver.backend = smt_backend
     POMDPQuotientContainer.initial_memory_size = pomdp_memory_size
     POMDPQuotientContainer.export_optimal_result = fsc_export_result
     POMDPQuotientContainer.posterior_aware = posterior_aware
@@ -157,6 +241,14 @@ def paynt(
     if not filetype=="cassandra" and not os.path.isfile(properties_path):
         raise ValueError(f"the properties file {properties_path} does not exist")
 
+    SynthesizerDistributedAR.sketch_arguments = (sketch_path, filetype, None,
+        properties_path, constants, relative_error)
+    if worker:
+        # the sketch is loaded using the configuration of the coordinator
+        run_worker(SynthesizerDistributedAR.address, SynthesizerDistributedAR.authkey,
+            sketch_arguments = SynthesizerDistributedAR.sketch_arguments)
+        return
+
     quotient = Sketch.load_sketch(sketch_path, filetype, export,
         properties_path, constants, relative_error)
 
@@ -197,6 +289,8 @@ def paynt(
         synthesizer = SynthesizerHybrid(quotient)
     elif method == "ar_multicore":
         synthesizer = SynthesizerMultiCoreAR(quotient)
+    elif method == "ar_distributed":
+        synthesizer = SynthesizerDistributedAR(quotient)
     else:
         pass
 
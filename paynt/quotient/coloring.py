@@ -2,110 +2,255 @@ import stormpy
 
 from .holes import Hole,Holes
 
+import numpy
+import itertools
+
 import logging
 logger = logging.getLogger(__name__)
 
 
 class MdpColoring:
-    ''' Labeling of actions of an MDP with hole options. '''
+    '''
+    Labeling of actions of an MDP with hole options.
+    The labeling is stored as flat numpy arrays: each hole-option label of a
+    choice is an entry in label_choice/label_hole/label_option (sorted by
+    choice), such that the selection of actions for a family can be computed
+    using vectorized mask operations.
+    If the memory budget allows, a bitvector of labeled choices is precomputed
+    for each hole-option pair and the selection is computed using bitvector
+    operations only.
+    The coloring can also be constructed directly from the flat label arrays
+    (e.g. mapped from shared memory), these are never modified.
+    '''
+
+    # memory budget (in bytes) for the precomputed hole-option bitvectors
+    bitvectors_memory_budget = 256 * 1024**2
 
-    def __init__(self, mdp, holes, action_to_hole_options):
+    def __init__(self, mdp, holes, action_to_hole_options = None, labels = None):
+        '''
+        :param action_to_hole_options for each choice, a dictionary of its
+          hole-option labels
+        :param labels alternatively, a triple of flat arrays label_choice,
+          label_hole, label_option (sorted by choice)
+        '''
+        assert (action_to_hole_options is None) != (labels is None)
 
         # reference to the quotient MDP
         self.mdp = mdp
         # design space
         self.holes = holes
         # for each choice of the quotient MDP contains a set of hole-option labelings
+        # (None if the coloring was constructed from the flat labels)
         self.action_to_hole_options = action_to_hole_options
 
+        # row group offsets of the quotient MDP
+        self.row_groups = None
+        # for each label, the labeled choice, the hole and the option
+        self.label_choice = None
+        self.label_hole = None
+        self.label_option = None
+        # for each hole, the offset of its options in the flat list of all hole options
+        self.hole_option_offsets = None
+        # for each label, the index of its hole-option pair in the flat list of all hole options
+        self.label_hole_option = None
+        # CSR: for each choice of the quotient MDP, offset of its labels
+        self.choice_label_offsets = None
+        # CSR: for each hole, indices of labels involving this hole
+        self.hole_label_offsets = None
+        self.hole_labels = None
+        # CSR: for each state of the quotient MDP, holes associated with the actions in this state
+        self.state_hole_offsets = None
+        self.state_hole_holes = None
+
         # bitvector of quotient MDP choices not labeled by any hole
         self.default_actions = None
+        # boolean mask of quotient MDP choices not labeled by any hole
+        self.default_actions_mask = None
         # for each state of the quotient MDP, a set of holes associated with the actions in this state
         self.state_to_holes = None
         # whether each state is marked by at most one hole
         self.coloring_is_simple = None
         # to each hole-option pair a list of actions colored by this combination
         self.hole_option_to_actions = None
+        # to each hole-option pair a bitvector of actions colored by this combination
+        self.hole_option_bitvectors = None
+
+        num_choices = self.mdp.nr_choices
+        num_states = self.mdp.nr_states
+        num_holes = self.holes.num_holes
+
+        if labels is not None:
+            self.label_choice, self.label_hole, self.label_option = labels
+            labels_per_choice = numpy.bincount(self.label_choice, minlength=num_choices)
+        else:
+            # flatten the labeling
+            labels_per_choice = numpy.fromiter(
+                (len(hole_options) for hole_options in self.action_to_hole_options),
+                dtype=numpy.int64, count=num_choices)
+            num_labels = int(labels_per_choice.sum())
+            self.label_choice = numpy.repeat(numpy.arange(num_choices, dtype=numpy.int64), labels_per_choice)
+            self.label_hole = numpy.fromiter(
+                itertools.chain.from_iterable(hole_options.keys() for hole_options in self.action_to_hole_options),
+                dtype=numpy.int64, count=num_labels)
+            self.label_option = numpy.fromiter(
+                itertools.chain.from_iterable(hole_options.values() for hole_options in self.action_to_hole_options),
+                dtype=numpy.int64, count=num_labels)
+
+        # labels are sorted by choice
+        self.choice_label_offsets = numpy.concatenate(([0], numpy.cumsum(labels_per_choice)))
+
+        options_per_hole = numpy.array([len(hole.option_labels) for hole in self.holes], dtype=numpy.int64)
+        self.hole_option_offsets = numpy.concatenate(([0], numpy.cumsum(options_per_hole)))
+        self.label_hole_option = self.hole_option_offsets[self.label_hole] + self.label_option
+
+        hole_order = numpy.argsort(self.label_hole, kind="stable")
+        self.hole_labels = hole_order
+        self.hole_label_offsets = numpy.concatenate(
+            ([0], numpy.cumsum(numpy.bincount(self.label_hole, minlength=num_holes))))
 
         # compute default actions
-        self.default_actions = stormpy.BitVector(self.mdp.nr_choices, False)
-        for choice in range(self.mdp.nr_choices):
-            if not self.action_to_hole_options[choice]:
-                self.default_actions.set(choice)
+        self.default_actions_mask = labels_per_choice == 0
+        self.default_actions = stormpy.BitVector(num_choices, numpy.flatnonzero(self.default_actions_mask).tolist())
 
         # collect relevant holes in states
-        tm = self.mdp.transition_matrix
-        self.state_to_holes = []
-        for state in range(self.mdp.nr_states):
-            relevant_holes = set()
-            for action in range(tm.get_row_group_start(state),tm.get_row_group_end(state)):
-                relevant_holes.update(set(self.action_to_hole_options[action].keys()))
-            self.state_to_holes.append(relevant_holes)
-
-        self.coloring_is_simple = all([
-            len(self.state_to_holes[state])<=1
-            for state in range(self.mdp.nr_states)
-        ])
-        
+        self.row_groups = numpy.array(self.mdp.nondeterministic_choice_indices, dtype=numpy.int64)
+        choice_to_state = numpy.repeat(numpy.arange(num_states, dtype=numpy.int64), numpy.diff(self.row_groups))
+        state_hole_pairs = numpy.unique(choice_to_state[self.label_choice] * max(num_holes,1) + self.label_hole)
+        pair_states = state_hole_pairs // max(num_holes,1)
+        self.state_hole_holes = state_hole_pairs % max(num_holes,1)
+        self.state_hole_offsets = numpy.concatenate(
+            ([0], numpy.cumsum(numpy.bincount(pair_states, minlength=num_states))))
+        state_hole_holes = self.state_hole_holes.tolist()
+        state_hole_offsets = self.state_hole_offsets.tolist()
+        self.state_to_holes = [
+            set(state_hole_holes[state_hole_offsets[state]:state_hole_offsets[state+1]])
+            for state in range(num_states)
+        ]
+
+        self.coloring_is_simple = bool(numpy.all(numpy.diff(self.state_hole_offsets) <= 1))
+
         # construct reverse coloring
-        self.hole_option_to_actions = [[] for hole in self.holes]
+        hole_option_order = numpy.argsort(self.label_hole_option, kind="stable")
+        hole_option_actions = self.label_choice[hole_option_order].tolist()
+        hole_option_offsets = numpy.concatenate(
+            ([0], numpy.cumsum(numpy.bincount(self.label_hole_option, minlength=self.hole_option_offsets[-1])))).tolist()
+        self.hole_option_to_actions = []
         for hole_index,hole in enumerate(self.holes):
-            self.hole_option_to_actions[hole_index] = [[] for option in hole.options]
-        for action in range(self.mdp.nr_choices):
-            for hole_index,option in self.action_to_hole_options[action].items():
-                self.hole_option_to_actions[hole_index][option].append(action)
+            first = self.hole_option_offsets[hole_index]
+            option_to_actions = [
+                hole_option_actions[hole_option_offsets[first+option]:hole_option_offsets[first+option+1]]
+                for option in range(options_per_hole[hole_index])
+            ]
+            self.hole_option_to_actions.append(option_to_actions)
+
+        # precompute hole-option bitvectors
+        if self.hole_option_offsets[-1] * num_choices / 8 <= MdpColoring.bitvectors_memory_budget:
+            self.hole_option_bitvectors = [
+                [stormpy.BitVector(num_choices, actions) for actions in option_to_actions]
+                for option_to_actions in self.hole_option_to_actions
+            ]
+
+
+    def family_option_mask(self, family):
+        ''' Boolean mask over all hole-option pairs that are included in the family. '''
+        mask = numpy.zeros(self.hole_option_offsets[-1], dtype=bool)
+        indices = itertools.chain.from_iterable(
+            (self.hole_option_offsets[hole_index] + option for option in hole.options)
+            for hole_index,hole in enumerate(family)
+        )
+        mask[numpy.fromiter(indices, dtype=numpy.int64)] = True
+        return mask
+
+
+    def count_states_per_hole(self, states):
+        ''' For each hole, count the states (of the provided list) in which this hole is relevant. '''
+        states = numpy.asarray(states, dtype=numpy.int64)
+        starts = self.state_hole_offsets[states]
+        counts = self.state_hole_offsets[states+1] - starts
+        # gather indices of all relevant state-hole pairs
+        shift = numpy.repeat(starts - (numpy.cumsum(counts) - counts), counts)
+        pairs = numpy.arange(counts.sum()) + shift
+        return numpy.bincount(self.state_hole_holes[pairs], minlength=self.holes.num_holes)
+
+
+    def choice_labels(self, choices):
+        '''
+        Gather labels of the provided choices of the quotient MDP.
+        :return indices of the labels (ordered as the choices)
+        :return for each choice, the number of its labels
+        '''
+        choices = numpy.asarray(choices, dtype=numpy.int64)
+        starts = self.choice_label_offsets[choices]
+        counts = self.choice_label_offsets[choices+1] - starts
+        shift = numpy.repeat(starts - (numpy.cumsum(counts) - counts), counts)
+        return numpy.arange(counts.sum()) + shift, counts
+
+
+    def hole_excluded_actions(self, family, hole_index):
+        ''' Array of actions labeled by options of the hole that are not included in the family. '''
+        labels = self.hole_labels[self.hole_label_offsets[hole_index]:self.hole_label_offsets[hole_index+1]]
+        hole_options = numpy.zeros(len(self.holes[hole_index].option_labels), dtype=bool)
+        hole_options[family[hole_index].options] = True
+        label_included = hole_options[self.label_option[labels]]
+        return self.label_choice[labels[~label_included]]
+
+
+    def excluded_actions(self, family, hole_index):
+        ''' Bitvector of actions labeled by options of the hole that are not included in the family. '''
+        hole = family[hole_index]
+        excluded = stormpy.BitVector(self.mdp.nr_choices, False)
+        for option,bitvector in enumerate(self.hole_option_bitvectors[hole_index]):
+            if not hole.includes_option(option):
+                excluded |= bitvector
+        return excluded
+
+
+    def select_actions_bitvectors(self, family):
+        '''
+        Select actions using precomputed hole-option bitvectors: an action is
+        selected iff it is not labeled by any option excluded from the family.
+        For a subfamily, only the actions of the splitter are removed from the
+        selection of the parent.
+        '''
+        if family.parent_info is None or family.parent_info.selected_actions is None:
+            excluded = stormpy.BitVector(self.mdp.nr_choices, False)
+            for hole_index,hole in enumerate(family):
+                if hole.is_unrefined:
+                    continue
+                excluded |= self.excluded_actions(family, hole_index)
+            return ~excluded
+        else:
+            splitter = family.parent_info.splitter
+            return family.parent_info.selected_actions & ~self.excluded_actions(family, splitter)
 
-    
 
-    
     def select_actions(self, family):
-        ''' Select non-default actions relevant in the provided design space. '''
-
-
-        hole_selected_actions = None
-        selected_actions = None
-
-        if not self.coloring_is_simple:
-            if family.parent_info is None:
-                # select from the super-quotient
-                selected_actions = []
-                for action in range(self.mdp.nr_choices):
-                    if self.default_actions[action]:
-                        continue
-                    hole_options = self.action_to_hole_options[action]
-                    if family.includes(hole_options):
-                        selected_actions.append(action)
-            else:
-                # filter each action in the parent wrt newly restricted design space
-                parent_actions = family.parent_info.selected_actions
-                selected_actions = []
-                for action in parent_actions:
-                    hole_options = self.action_to_hole_options[action]
-                    # if family.includes(hole_options):
-                    if family.parent_info.splitter not in hole_options or family.includes(hole_options):
-                        selected_actions.append(action)
+        '''
+        Select non-default actions relevant in the provided design space.
+        :return a compact description of the selection that can be stored in
+          the parent info of subfamilies: either an array of selected
+          non-default actions or the bitvector of all selected actions
+        :return bitvector of all selected actions (including the default ones)
+        '''
+
+        if self.hole_option_bitvectors is not None:
+            selected_actions_bv = self.select_actions_bitvectors(family)
+            return selected_actions_bv,selected_actions_bv
+
+        if family.parent_info is None or family.parent_info.selected_actions is None:
+            # select from the super-quotient: exclude actions having a label
+            # not included in the family
+            selected = numpy.ones(self.mdp.nr_choices, dtype=bool)
+            label_included = self.family_option_mask(family)[self.label_hole_option]
+            selected[self.label_choice[~label_included]] = False
         else:
-            if family.parent_info is None:
-                hole_selected_actions = []
-                for hole_index,hole in enumerate(family):
-                    hole_actions = []
-                    for option in hole.options:
-                        hole_actions += self.hole_option_to_actions[hole_index][option]
-                    hole_selected_actions.append(hole_actions)
-
-            else:
-                hole_selected_actions = family.parent_info.hole_selected_actions.copy()
-                splitter = family.parent_info.splitter
-                splitter_actions = []
-                for option in family[splitter].options:
-                    splitter_actions += self.hole_option_to_actions[splitter][option]
-                hole_selected_actions[splitter] = splitter_actions
-
-            selected_actions = []
-            for actions in hole_selected_actions:
-                selected_actions += actions
+            # filter actions in the parent wrt the restricted splitter
+            selected = self.default_actions_mask.copy()
+            selected[family.parent_info.selected_actions] = True
+            selected[self.hole_excluded_actions(family, family.parent_info.splitter)] = False
 
         # construct bitvector of selected actions
-        selected_actions_bv = stormpy.synthesis.construct_selection(self.default_actions, selected_actions)
-        
-        return hole_selected_actions,selected_actions,selected_actions_bv
+        selected_actions = numpy.flatnonzero(selected & ~self.default_actions_mask)
+        selected_actions_bv = stormpy.BitVector(self.mdp.nr_choices, numpy.flatnonzero(selected).tolist())
+
+        return selected_actions,selected_actions_bv
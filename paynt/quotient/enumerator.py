@@ -0,0 +1,215 @@
+import logging
+logger = logging.getLogger(__name__)
+
+
+class CubeEnumerator:
+    '''
+    Built-in alternative to an SMT solver for the enumeration of hole
+    assignments: the excluded subfamilies are stored as cubes (for each hole,
+    a bitmask of its excluded options) and indexed per hole. The cubes are
+    numbered, and sets of cubes are represented as bitsets (integers):
+    - constrained[h] contains cubes that do not include all options of hole h
+    - index[h][o] contains constrained cubes that include option o of hole h
+    The next non-excluded assignment of a family is found by a backtracking
+    search over holes that maintains the set of cubes containing the partial
+    assignment: an option is skipped as soon as some cube containing the
+    extended partial assignment covers all of its completions in the family.
+    Cubes are scoped using push/pop, as assertions of an SMT solver. The same
+    indexes answer subsumption queries, such that the enumerator also serves
+    as the conflict store of SmtSolver.
+    '''
+
+    def __init__(self, family):
+        # for each hole, the mask of all its options
+        self.full_masks = [(1 << len(hole.option_labels)) - 1 for hole in family]
+        # number of stored cubes
+        self.num_cubes = 0
+        # stored cubes, None if removed
+        self.cubes = []
+        # bitset of removed cubes
+        self.removed = 0
+        self.constrained = [0] * family.num_holes
+        self.index = [[0] * len(hole.option_labels) for hole in family]
+        # for each scope, the number of cubes stored before it was opened
+        self.scopes = []
+
+    def push(self):
+        self.scopes.append(self.num_cubes)
+
+    def pop(self):
+        num_cubes = self.scopes.pop()
+        if num_cubes == self.num_cubes:
+            return
+        self.num_cubes = num_cubes
+        del self.cubes[num_cubes:]
+        keep = (1 << num_cubes) - 1
+        self.removed &= keep
+        for hole_index,constrained in enumerate(self.constrained):
+            if constrained >> num_cubes == 0:
+                continue
+            self.constrained[hole_index] = constrained & keep
+            options = self.index[hole_index]
+            for option,cubes in enumerate(options):
+                options[option] = cubes & keep
+
+    def exclude(self, cube):
+        '''
+        Exclude all assignments within the cube.
+        :param cube for each hole, a bitmask of the excluded options
+        '''
+        cube_bit = 1 << self.num_cubes
+        self.num_cubes += 1
+        self.cubes.append(cube)
+        for hole_index,mask in enumerate(cube):
+            if mask == self.full_masks[hole_index]:
+                continue
+            self.constrained[hole_index] |= cube_bit
+            options = self.index[hole_index]
+            option = 0
+            while mask:
+                if mask & 1:
+                    options[option] |= cube_bit
+                mask >>= 1
+                option += 1
+
+    def live_cubes(self):
+        return ((1 << self.num_cubes) - 1) & ~self.removed
+
+    def scope_cubes(self):
+        ''' For each scope (including the outermost one), the list of its live cubes. '''
+        bounds = [0] + self.scopes + [self.num_cubes]
+        return [
+            [cube for cube in self.cubes[first:last] if cube is not None]
+            for first,last in zip(bounds, bounds[1:])
+        ]
+
+    def remove(self, cubes):
+        ''' Remove the cubes in the bitset. '''
+        for hole_index,constrained in enumerate(self.constrained):
+            if constrained & cubes == 0:
+                continue
+            self.constrained[hole_index] = constrained & ~cubes
+            options = self.index[hole_index]
+            for option,option_cubes in enumerate(options):
+                options[option] = option_cubes & ~cubes
+        self.removed |= cubes
+        cube_index = 0
+        while cubes:
+            if cubes & 1:
+                self.cubes[cube_index] = None
+            cubes >>= 1
+            cube_index += 1
+
+    def including_cubes(self, cube):
+        ''' Bitset of stored cubes that include the cube. '''
+        cubes = self.live_cubes()
+        for hole_index,mask in enumerate(cube):
+            constrained = self.constrained[hole_index]
+            if constrained == 0:
+                continue
+            if mask == self.full_masks[hole_index]:
+                cubes &= ~constrained
+            else:
+                options = self.index[hole_index]
+                option = 0
+                while mask:
+                    if mask & 1:
+                        cubes &= ~(constrained ^ options[option])
+                    mask >>= 1
+                    option += 1
+            if cubes == 0:
+                break
+        return cubes
+
+    def included_cubes(self, cube):
+        ''' Bitset of cubes of the innermost scope that are included in the cube. '''
+        first = self.scopes[-1] if self.scopes else 0
+        cubes = self.live_cubes() & ~((1 << first) - 1)
+        for hole_index,mask in enumerate(cube):
+            if cubes == 0:
+                break
+            if mask == self.full_masks[hole_index]:
+                continue
+            # cubes must be constrained and must not include the options outside of the mask
+            cubes &= self.constrained[hole_index]
+            options = self.index[hole_index]
+            excluded = self.full_masks[hole_index] & ~mask
+            option = 0
+            while excluded:
+                if excluded & 1:
+                    cubes &= ~options[option]
+                excluded >>= 1
+                option += 1
+        return cubes
+
+    def uncovering_cubes(self, family):
+        '''
+        :return for each hole, the cubes that do not include all options of
+          this hole in the family
+        '''
+        uncovering = [0] * family.num_holes
+        for hole_index,constrained in enumerate(self.constrained):
+            if constrained == 0:
+                continue
+            hole = family[hole_index]
+            if hole.mask == self.full_masks[hole_index]:
+                uncovering[hole_index] = constrained
+                continue
+            covering = constrained
+            options = self.index[hole_index]
+            for option in hole.options:
+                covering &= options[option]
+            uncovering[hole_index] = constrained & ~covering
+        return uncovering
+
+    def pick_assignment(self, family):
+        '''
+        :return for each hole, an option such that the assignment is not
+          excluded (or None if all members of the family are excluded)
+        '''
+        num_holes = family.num_holes
+        uncovering = self.uncovering_cubes(family)
+        # suffix[depth] contains the cubes that do not cover the options of
+        #   some hole from depth onwards
+        suffix = [0] * (num_holes + 1)
+        for hole_index in range(num_holes-1, -1, -1):
+            suffix[hole_index] = suffix[hole_index+1] | uncovering[hole_index]
+
+        # alive[depth] contains the cubes containing the partial assignment
+        #   of holes before depth
+        alive = [0] * (num_holes + 1)
+        alive[0] = self.live_cubes()
+        if alive[0] & ~suffix[0]:
+            # the whole family is excluded
+            return None
+
+        options = [hole.options for hole in family]
+        assignment = [None] * num_holes
+        position = [0] * (num_holes + 1)
+        depth = 0
+        while depth < num_holes:
+            hole_options = options[depth]
+            constrained = self.constrained[depth]
+            hole_index = self.index[depth]
+            extended = False
+            while position[depth] < len(hole_options):
+                option = hole_options[position[depth]]
+                position[depth] += 1
+                cubes = alive[depth] & ~(constrained ^ hole_index[option])
+                if cubes & ~suffix[depth+1]:
+                    # some cube covers all completions
+                    continue
+                alive[depth+1] = cubes
+                assignment[depth] = option
+                extended = True
+                break
+            if extended:
+                depth += 1
+                position[depth] = 0
+            else:
+                # backtrack
+                position[depth] = 0
+                depth -= 1
+                if depth < 0:
+                    return None
+        return assignment
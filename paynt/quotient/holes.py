@@ -1,32 +1,64 @@
 import stormpy.synthesis
 
 from .smt import FamilyEncoding
+from .property import MdpPropertyResult, MdpConstraintsResult, MdpOptimalityResult, SpecificationResult
 
 import math
 import itertools
+import numpy
 
 import logging
 logger = logging.getLogger(__name__)
 
 class Hole:
     '''
-    Hole with a name, a list of options and corresponding option labels.
+    Hole with a name, a set of options and corresponding option labels.
     Options for each hole are simply indices of the corresponding hole
-      assignment, therefore, their order does not matter.
-      # TODO maybe store options as bitmaps?
+      assignment, therefore, their order does not matter. Internally, options
+      are stored as a bitmask (an integer whose i-th bit is set iff option i
+      is available), which allows O(1) membership checks and cheap
+      intersections; the options are provided as a tuple, which copies of
+      the hole can safely share.
     Each hole is identified by its position hole_index in Holes, therefore,
       this order must be preserved in the refining process.
     Option labels are not refined when assuming suboptions so that the correct
       label can be accessed by the value of an option.
     '''
+    __slots__ = ["name", "option_labels", "mask", "_options"]
+
     def __init__(self, name, options, option_labels):
         self.name = name
-        self.options = options
         self.option_labels = option_labels
+        self.assume_options(options)
+
+    @staticmethod
+    def options_to_mask(options):
+        mask = 0
+        for option in options:
+            mask |= 1 << option
+        return mask
+
+    @staticmethod
+    def mask_to_options(mask):
+        options = []
+        option = 0
+        while mask:
+            if mask & 1:
+                options.append(option)
+            mask >>= 1
+            option += 1
+        return tuple(options)
+
+    @property
+    def options(self):
+        ''' Tuple of the options, use assume_options() to modify. '''
+        if self._options is None:
+            self._options = Hole.mask_to_options(self.mask)
+        return self._options
 
     @property
     def size(self):
-        return len(self.options)
+        return bin(self.mask).count("1")
 
     @property
     def is_trivial(self):
@@ -36,6 +68,9 @@ class Hole:
     def is_unrefined(self):
         return self.size == len(self.option_labels)
 
+    def includes_option(self, option):
+        return (self.mask >> option) & 1 == 1
+
     def __str__(self):
         labels = [self.option_labels[option] for option in self.options]
         if self.size == 1:
@@ -45,17 +80,41 @@ class Hole:
 
     def assume_options(self, options):
         assert len(options) > 0
-        self.options = options
+        self.mask = Hole.options_to_mask(options)
+        self._options = tuple(options)
+
+    def assume_mask(self, mask):
+        assert mask != 0
+        self.mask = mask
+        self._options = None
+
+    def intersect_mask(self, mask):
+        ''' Restrict options of this hole to the ones set in the mask. '''
+        self.assume_mask(self.mask & mask)
 
     def copy(self):
         # note that the copy is shallow since after assuming some options
-        # the corresponding list is replaced
-        return Hole(self.name, self.options, self.option_labels)
+        # the corresponding mask (and options tuple) is replaced
+        hole = Hole.__new__(Hole)
+        hole.name = self.name
+        hole.option_labels = self.option_labels
+        hole.mask = self.mask
+        hole._options = self._options
+        return hole
 
 
 
 class Holes(list):
-    ''' List of holes. '''
+    '''
+    List of holes.
+    Hole objects are never modified in place once they are part of a family:
+      copies of Holes share the hole objects and a hole is replaced by its
+      modified copy upon restriction (copy-on-write). The per-family state is
+      therefore only a list of references, the names and the option labels
+      being shared by all families.
+    '''
+
+    __slots__ = []
 
     def __init__(self, *args):
         super().__init__(*args)
@@ -76,18 +135,38 @@ class Holes(list):
     def __str__(self):
         return ", ".join([str(hole) for hole in self]) 
 
+    @property
+    def option_masks(self):
+        ''' Compact representation of the family: a tuple of option bitmasks. '''
+        return tuple(hole.mask for hole in self)
+
     def copy(self):
-        ''' Create a shallow copy of this list of holes. '''
-        return Holes([hole.copy() for hole in self])
+        ''' Create a shallow (copy-on-write) copy of this list of holes. '''
+        return Holes(self)
 
     def assume_hole_options(self, hole_index, options):
         ''' Assume suboptions of a certain hole. '''
-        self[hole_index].assume_options(options)
+        hole = self[hole_index].copy()
+        hole.assume_options(options)
+        self[hole_index] = hole
+
+    def assume_hole_mask(self, hole_index, mask):
+        ''' Assume suboptions of a certain hole given as a bitmask. '''
+        if self[hole_index].mask == mask:
+            return
+        hole = self[hole_index].copy()
+        hole.assume_mask(mask)
+        self[hole_index] = hole
 
     def assume_options(self, hole_options):
         ''' Assume suboptions for each hole. '''
-        for hole_index,hole in enumerate(self):
-            hole.assume_options(hole_options[hole_index])
+        for hole_index in self.hole_indices:
+            self.assume_hole_options(hole_index, hole_options[hole_index])
+
+    def assume_option_masks(self, option_masks):
+        ''' Assume suboptions for each hole given as bitmasks. '''
+        for hole_index,mask in enumerate(option_masks):
+            self.assume_hole_mask(hole_index, mask)
 
     def pick_any(self):
         suboptions = [[hole.options[0]] for hole in self]
@@ -100,7 +179,7 @@ class Holes(list):
         :return True if this family contains hole_assignment
         '''
         for hole_index,option in hole_assignment.items():
-            if not option in self[hole_index].options:
+            if not self[hole_index].includes_option(option):
                 return False
         return True
 
@@ -125,11 +204,8 @@ class Holes(list):
         :note this is a performance/memory optimization associated with creating
           subfamilies wrt one splitter having restricted options
         '''
-        subhole = self[hole_index].copy()
-        subhole.assume_options(options)
-        
         shallow_copy = Holes(self)
-        shallow_copy[hole_index] = subhole
+        shallow_copy.assume_hole_options(hole_index, options)
         return shallow_copy
 
 
@@ -140,23 +216,102 @@ class ParentInfo():
     :note it is better to store these things in a separate container instead
       of having a reference to the parent family (that will never be considered
       again) for the purposes of memory efficiency.
+    :note the container is shared by all subfamilies and is alive as long as
+      any of them is pending; therefore, it keeps no reference to the parent
+      MDP wrapper (the sparse model of the parent is kept only upon request
+      for the incremental construction of subfamily MDPs) and all vectors are
+      stored as compact numpy arrays.
     '''
+
+    __slots__ = [
+        "property_indices", "property_bounds", "analysis_hints", "hint_states", "refinement_depth",
+        "selected_actions", "splitter",
+        "model", "quotient_state_map", "quotient_choice_map"
+    ]
+
+    # type of the stored action indices
+    action_dtype = numpy.uint32
+
     def __init__(self):
         # list of constraint indices still undecided in this family
         self.property_indices = None
-        # for each undecided property contains analysis results
+        # for each undecided property, a pair of values in the initial state
+        # (primary, secondary) bounding the values of any subfamily
+        self.property_bounds = None
+        # for each undecided property contains a lower bound on its values
         self.analysis_hints = None
+        # sorted array of quotient states, analysis hints are aligned with this array
+        self.hint_states = None
 
         # how many refinements were needed to create this family
         self.refinement_depth = None
 
-        # explicit list of all non-default actions in the MDP
+        # selection of actions in the MDP (see MdpColoring.select_actions):
+        #   array of selected non-default actions or a bitvector of all selected actions
         self.selected_actions = None
-        # for each hole and for each option explicit list of all non-default actions in the MDP
-        self.hole_selected_actions = None
         # index of a hole used to split the family
         self.splitter = None
 
+        # (optional) sparse model of the parent MDP and arrays mapping its
+        # states and choices to the quotient
+        self.model = None
+        self.quotient_state_map = None
+        self.quotient_choice_map = None
+
+    def retained_bytes(self):
+        ''' Estimate the memory (in bytes) occupied by vectors stored in this container. '''
+        size = 0
+        if self.hint_states is not None:
+            size += self.hint_states.nbytes
+        if self.analysis_hints is not None:
+            size += sum([hint.nbytes for hint in self.analysis_hints.values()])
+        if isinstance(self.selected_actions, numpy.ndarray):
+            size += self.selected_actions.nbytes
+        elif self.selected_actions is not None:
+            size += (self.selected_actions.size() + 63) // 64 * 8
+        if self.quotient_state_map is not None:
+            size += self.quotient_state_map.nbytes + self.quotient_choice_map.nbytes
+        return size
+
+    @staticmethod
+    def compress_hint(hint):
+        ''' Convert hint values to single precision, rounding down to keep them lower bounds. '''
+        compressed = hint.astype(numpy.float32)
+        rounded_up = compressed > hint
+        compressed[rounded_up] = numpy.nextafter(compressed[rounded_up], numpy.float32(-numpy.inf))
+        return numpy.maximum(compressed, 0)
+
+    def to_compact(self, specification):
+        '''
+        Picklable summary of this parent info: refinement depth, undecided
+        constraints, splitter, bounds and (if stored) single-precision hints.
+        Properties are referred to by their index in the specification.
+        Selected actions and the parent MDP are not retained.
+        '''
+        prop_index = {prop:index for index,prop in enumerate(specification.all_properties())}
+        property_bounds = None
+        if self.property_bounds is not None:
+            property_bounds = {prop_index[prop]:bounds for prop,bounds in self.property_bounds.items()}
+        hints = None
+        if self.analysis_hints is not None:
+            analysis_hints = {prop_index[prop]:ParentInfo.compress_hint(hint) for prop,hint in self.analysis_hints.items()}
+            hints = (self.hint_states.astype(numpy.uint32), analysis_hints)
+        return (self.refinement_depth, self.property_indices, self.splitter, property_bounds, hints)
+
+    @classmethod
+    def from_compact(cls, compact, specification):
+        ''' Reconstruct the parent info from its summary. '''
+        properties = specification.all_properties()
+        pi = cls()
+        pi.refinement_depth, pi.property_indices, pi.splitter, property_bounds, hints = compact
+        if property_bounds is not None:
+            pi.property_bounds = {properties[index]:bounds for index,bounds in property_bounds.items()}
+        if hints is not None:
+            hint_states, analysis_hints = hints
+            pi.hint_states = hint_states.astype(numpy.int64)
+            pi.analysis_hints = {properties[index]:hint for index,hint in analysis_hints.items()}
+        return pi
+
 
 class DesignSpace(Holes):
     '''
@@ -164,10 +319,20 @@ class DesignSpace(Holes):
     - a list of constraint indices to investigate in this design space
     - (optionally) z3 encoding of this design space
     :note z3 (re-)encoding construction must be invoked manually
+    :note the design space does not have a __dict__, only the attributes
+      listed in __slots__ can be set
     '''
 
-    # whether hints will be stored for subsequent MDP model checking
-    store_hints = True
+    __slots__ = [
+        "mdp", "encoding", "selected_actions",
+        "refinement_depth", "property_indices", "analysis_result", "splitter",
+        "parent_info"
+    ]
+
+    # whether hints will be stored for subsequent MDP model checking (warm start)
+    store_hints = False
+    # type of the stored hint values, numpy.float32 halves the memory footprint
+    hint_dtype = numpy.float64
     
     def __init__(self, holes = [], parent_info = None):
         super().__init__(holes)
@@ -177,7 +342,6 @@ class DesignSpace(Holes):
         # SMT encoding
         self.encoding = None
 
-        self.hole_selected_actions = None
         self.selected_actions = None
         self.refinement_depth = 0
         self.property_indices = None
@@ -192,68 +356,152 @@ class DesignSpace(Holes):
     def copy(self):
         return DesignSpace(super().copy())
 
-    
-    def generalize_hint(self, hint):
-        hint_global = dict()
-        hint = list(hint.get_values())
-        for state in range(self.mdp.states):
-            hint_global[self.mdp.quotient_state_map[state]] = hint[state]
-        return hint_global
+    def to_compact(self, specification = None):
+        '''
+        Compact picklable representation of this family: hole-option masks,
+        refinement depth, undecided constraints and a summary of the parent
+        info (see ParentInfo.to_compact). The parent info is retained only if
+        the specification is provided.
+        '''
+        parent_info = None
+        if specification is not None and self.parent_info is not None:
+            parent_info = self.parent_info.to_compact(specification)
+        return (self.option_masks, self.refinement_depth, self.property_indices, parent_info)
+
+    def from_compact(self, compact, specification = None):
+        ''' Reconstruct a subfamily of this design space from its compact representation. '''
+        option_masks, refinement_depth, property_indices, parent_info = compact
+        family = self.copy()
+        family.assume_option_masks(option_masks)
+        family.refinement_depth = refinement_depth
+        family.property_indices = property_indices
+        if parent_info is not None and specification is not None:
+            family.parent_info = ParentInfo.from_compact(parent_info, specification)
+        return family
 
     
-    def generalize_hints(self, result):
-        hint_prim = self.generalize_hint(result.primary.result)
-        hint_seco = self.generalize_hint(result.secondary.result) if result.secondary is not None else None
-        return (hint_prim, hint_seco)
+    def generalize_hint(self, result, order):
+        '''
+        Reorder values of the minimizing direction to be aligned with the
+        sorted quotient states. Since a subfamily has fewer actions in each
+        state, these values are a lower bound for both directions in any
+        subfamily and thus a sound starting point for value iteration.
+        Infinite values (rewards) are replaced by the trivial lower bound 0.
+        :return array of hint values or None if the minimizing direction was
+          not computed
+        '''
+        min_result = result.primary if result.minimizing else result.secondary
+        if min_result is None:
+            return None
+        hint = numpy.array(min_result.result.get_values(), dtype=DesignSpace.hint_dtype)[order]
+        hint[~numpy.isfinite(hint)] = 0
+        return hint
 
     
     def collect_analysis_hints(self, specification):
+        '''
+        :return sorted array of quotient states of the MDP of this family
+        :return for each undecided property, a hint array aligned with these
+          states
+        '''
+        state_map = numpy.array(self.mdp.quotient_state_map, dtype=numpy.int64)
+        order = numpy.argsort(state_map, kind="stable")
+        hint_states = state_map[order]
+
         res = self.analysis_result
-        analysis_hints = dict()
-        for index in res.constraints_result.undecided_constraints:
-            prop = specification.constraints[index]
-            hints = self.generalize_hints(res.constraints_result.results[index])
-            analysis_hints[prop] = hints
+        results = []
+        if res.constraints_result is not None:
+            for index in res.constraints_result.undecided_constraints:
+                results.append( (specification.constraints[index], res.constraints_result.results[index]) )
         if res.optimality_result is not None:
-            prop = specification.optimality
-            hints = self.generalize_hints(res.optimality_result)
-            analysis_hints[prop] = hints
-        return analysis_hints
+            results.append( (specification.optimality, res.optimality_result) )
 
-    
-    def translate_analysis_hint(self, hint):
-        if hint is None:
-            return None
-        translated_hint = [0] * self.mdp.states
-        for state in range(self.mdp.states):
-            global_state = self.mdp.quotient_state_map[state]
-            translated_hint[state] = hint[global_state]
-        return translated_hint
+        analysis_hints = dict()
+        for prop,result in results:
+            hint = self.generalize_hint(result, order)
+            if hint is not None:
+                analysis_hints[prop] = hint
+        return hint_states, analysis_hints
 
     
     def translate_analysis_hints(self):
-        if not DesignSpace.store_hints or self.parent_info is None:
+        ''' Map hints of the parent family onto the states of the MDP of this family. '''
+        if not DesignSpace.store_hints or self.parent_info is None or self.parent_info.analysis_hints is None:
             return None
 
-        analysis_hints = dict()
-        for prop,hints in self.parent_info.analysis_hints.items():
-            hint_prim,hint_seco = hints
-            translated_hint_prim = self.translate_analysis_hint(hint_prim)
-            translated_hint_seco = self.translate_analysis_hint(hint_seco)
-            analysis_hints[prop] = (translated_hint_prim,translated_hint_seco)
+        # locate states of this MDP among the states of the parent MDP
+        hint_states = self.parent_info.hint_states
+        state_map = numpy.array(self.mdp.quotient_state_map, dtype=numpy.int64)
+        positions = numpy.searchsorted(hint_states, state_map)
+        positions = numpy.minimum(positions, len(hint_states)-1)
+        found = hint_states[positions] == state_map
 
+        analysis_hints = dict()
+        for prop,hint in self.parent_info.analysis_hints.items():
+            analysis_hints[prop] = numpy.where(found, hint[positions], 0).tolist()
         return analysis_hints
 
+    def collect_property_bounds(self, specification):
+        '''
+        :return for each undecided property, values of the primary and the
+          secondary direction in the initial state (None if not computed)
+        '''
+        res = self.analysis_result
+        property_bounds = dict()
+        if res.constraints_result is not None:
+            for index in res.constraints_result.undecided_constraints:
+                result = res.constraints_result.results[index]
+                property_bounds[specification.constraints[index]] = result.bounds()
+        if res.optimality_result is not None:
+            property_bounds[specification.optimality] = res.optimality_result.bounds()
+        return property_bounds
+
+
+    def inherited_bounds(self, prop):
+        ''' :return values (primary, secondary) of the parent family bounding this family, or None '''
+        if self.parent_info is None or self.parent_info.property_bounds is None:
+            return None
+        return self.parent_info.property_bounds.get(prop)
+
+
+    def check_parent_bounds(self, specification):
+        '''
+        Try to decide this family using the bounds inherited from the parent
+        family, without constructing its MDP. Only the optimality can be
+        decided: constraints inherited as undecided were undecided for the
+        same bounds and thresholds, whereas the optimum might have improved
+        since the parent was analyzed. The constraints of a family that
+        cannot improve the optimum are reported as undecided.
+        :return specification result if the family was decided, None otherwise
+        '''
+        if not specification.has_optimality:
+            return None
+        prop = specification.optimality
+        bounds = self.inherited_bounds(prop)
+        if bounds is None or prop.decide_bounds(*bounds) != False:
+            return None
+
+        # the family cannot improve the optimum
+        results = [None for _ in specification.constraints]
+        for index in self.property_indices:
+            results[index] = MdpPropertyResult(specification.constraints[index], None, None, None, None, None, None, None)
+        optimality_result = MdpOptimalityResult(prop, None, None, None, None, False, None, None, None, None)
+        return SpecificationResult(MdpConstraintsResult(results), optimality_result)
+
+
     def collect_parent_info(self, specification):
         pi = ParentInfo()
-        pi.hole_selected_actions = self.hole_selected_actions
-        pi.selected_actions = self.selected_actions
+        if isinstance(self.selected_actions, numpy.ndarray):
+            pi.selected_actions = self.selected_actions.astype(ParentInfo.action_dtype)
+        else:
+            pi.selected_actions = self.selected_actions
         pi.refinement_depth = self.refinement_depth
-        pi.analysis_hints = self.collect_analysis_hints(specification)
+        if DesignSpace.store_hints:
+            pi.hint_states, pi.analysis_hints = self.collect_analysis_hints(specification)
         cr = self.analysis_result.constraints_result
         pi.property_indices = cr.undecided_constraints if cr is not None else []
+        pi.property_bounds = self.collect_property_bounds(specification)
         pi.splitter = self.splitter
-        pi.mdp = self.mdp
         return pi
 
     def encode(self, smt_solver):
@@ -296,7 +544,7 @@ class CombinationColoring:
             for hole_index,hole in enumerate(subspace):
                 if combination[hole_index] is None:
                     continue
-                if combination[hole_index] not in hole.options:
+                if not hole.includes_option(combination[hole_index]):
                     contained = False
                     break
             if contained:
@@ -305,9 +553,11 @@ class CombinationColoring:
         return colors
 
     def subcolors_proper(self, hole_index, options):
+        mask = Hole.options_to_mask(options)
         colors = set()
         for combination,color in self.coloring.items():
-            if combination[hole_index] in options:
+            option = combination[hole_index]
+            if option is not None and (mask >> option) & 1:
                 colors.add(color)
         return colors
 
@@ -1,9 +1,50 @@
 import stormpy
 
 from .property import *
+from ..utils.profiler import Timer
 
 from collections import OrderedDict
+import ctypes
+import os
 import random
+import re
+import sys
+import tempfile
+
+
+# message of storm iterative solvers reporting the number of iterations
+SOLVER_ITERATIONS = re.compile(r"after (\d+) iteration")
+
+def count_solver_iterations(check):
+    '''
+    Run the model checking call with the log of storm redirected to a
+    temporary file and sum up the iterations reported by its solvers (storm
+    does not expose the number of iterations otherwise).
+    :note this is a diagnostic used only with --count-iterations: file
+      descriptor 1 is redirected for the duration of the call, hence any other
+      output written to stdout meanwhile (e.g. by another thread) is swallowed,
+      and the log level of storm is reset to errors afterwards
+    :param check a function performing the model checking call
+    :return the result of the call and the number of iterations
+    '''
+    libc = ctypes.CDLL(None)
+    sys.stdout.flush()
+    libc.fflush(None)
+    stdout = os.dup(1)
+    with tempfile.TemporaryFile(mode="w+") as log:
+        os.dup2(log.fileno(), 1)
+        stormpy.set_loglevel_debug()
+        try:
+            result = check()
+        finally:
+            libc.fflush(None)
+            stormpy.set_loglevel_error()
+            os.dup2(stdout, 1)
+            os.close(stdout)
+        log.seek(0)
+        iterations = sum(int(count) for count in SOLVER_ITERATIONS.findall(log.read()))
+    return result, iterations
+
 
 class MarkovChain:
 
@@ -12,6 +53,18 @@ class MarkovChain:
     # model checking environment (method & precision)
     environment = None
 
+    # number and duration of MDP model checking calls without/with a hint
+    checks_cold = 0
+    checks_warm = 0
+    timer_cold = Timer()
+    timer_warm = Timer()
+    # if True, the number of solver iterations of MDP model checking calls is
+    # extracted from the log of storm (see count_solver_iterations), which
+    # slows model checking down
+    count_iterations = False
+    iterations_cold = 0
+    iterations_warm = 0
+
     @classmethod
     def initialize(cls, specification):
         # builder options
@@ -34,6 +87,7 @@ class MarkovChain:
         # se.set_linear_equation_solver_type(stormpy.EquationSolverType.eigen)
 
         # se.minmax_solver_environment.method = stormpy.MinMaxMethod.policy_iteration
+        # warm start (see model_check_property) relies on value iteration
         se.minmax_solver_environment.method = stormpy.MinMaxMethod.value_iteration
         # se.minmax_solver_environment.method = stormpy.MinMaxMethod.sound_value_iteration
         # se.minmax_solver_environment.method = stormpy.MinMaxMethod.interval_iteration
@@ -66,12 +120,8 @@ class MarkovChain:
         self.quotient_state_map = quotient_state_map
 
         # identify simple holes
-        design_space = quotient_container.design_space
-        hole_to_states = [0 for hole in design_space]
-        for state in range(self.states):
-            for hole in quotient_container.coloring.state_to_holes[self.quotient_state_map[state]]:
-                hole_to_states[hole] += 1
-        self.hole_simple = [hole_to_states[hole] <= 1 for hole in design_space.hole_indices]
+        hole_to_states = quotient_container.coloring.count_states_per_hole(self.quotient_state_map)
+        self.hole_simple = (hole_to_states <= 1).tolist()
 
         self.analysis_hints = None
     
@@ -101,8 +151,9 @@ class MarkovChain:
         )
 
     def model_check_formula_hint(self, formula, hint):
-        raise RuntimeError("model checking with hints is not fully supported")
-        stormpy.synthesis.set_loglevel_off()
+        # the hint is sound only as a starting vector of value iteration (see model_check_property)
+        if self.environment.solver_environment.minmax_solver_environment.method != stormpy.MinMaxMethod.value_iteration:
+            raise RuntimeError("model checking with hints is supported only for value iteration")
         task = stormpy.core.CheckTask(formula, only_initial_states=False)
         task.set_produce_schedulers(produce_schedulers=True)
         result = stormpy.synthesis.model_check_with_hint(self.model, task, self.environment, hint)
@@ -110,18 +161,40 @@ class MarkovChain:
 
     def model_check_property(self, prop, alt = False):
         direction = "prim" if not alt else "seco"
-        # get hint
+        # get hint: values of the parent family in the minimizing direction.
+        # A subfamily only removes actions, hence its minimal values are not
+        # below the minimal values of the parent and its maximal values are not
+        # below its minimal ones: the hint is a lower bound for both directions
+        # (infinite rewards are replaced by 0, see DesignSpace.generalize_hint).
+        # Value iteration started from a vector below the least fixed point
+        # converges to it, as it does from the default all-zero vector, so the
+        # hint is sound for min and max only because the environment uses
+        # (unbounded) value iteration; it must not be used as an upper bound.
         hint = None
         if self.analysis_hints is not None:
-            hint_prim,hint_seco = self.analysis_hints[prop]
-            hint = hint_prim if not alt else hint_seco
-            # hint = self.analysis_hints[prop]
+            hint = self.analysis_hints.get(prop)
 
         formula = prop.formula if not alt else prop.formula_alt
-        if hint is None:
+        if self.is_dtmc:
             result = self.model_check_formula(formula)
+        elif hint is None:
+            MarkovChain.checks_cold += 1
+            MarkovChain.timer_cold.start()
+            if MarkovChain.count_iterations:
+                result,iterations = count_solver_iterations(lambda: self.model_check_formula(formula))
+                MarkovChain.iterations_cold += iterations
+            else:
+                result = self.model_check_formula(formula)
+            MarkovChain.timer_cold.stop()
         else:
-            result = self.model_check_formula_hint(formula, hint)
+            MarkovChain.checks_warm += 1
+            MarkovChain.timer_warm.start()
+            if MarkovChain.count_iterations:
+                result,iterations = count_solver_iterations(lambda: self.model_check_formula_hint(formula, hint))
+                MarkovChain.iterations_warm += iterations
+            else:
+                result = self.model_check_formula_hint(formula, hint)
+            MarkovChain.timer_warm.stop()
         
         value = result.at(self.initial_state)
 
@@ -251,10 +324,10 @@ class MDP(MarkovChain):
         # LB < UB < OPT
         # this family definitely improves the optimum
         assignment = self.design_space.pick_any()
-        improving_assignment, improving_value = self.quotient_container.double_check_assignment(assignment, prop)
+        improving_assignment, improving_value = self.quotient_container.double_check_assignment(assignment)
         # either LB < T, LB < UB < OPT (can improve) or T < LB < UB < OPT (cannot improve)
         can_improve = primary.sat
-        return MdpOptimalityResult(prop, primary, secondary, improving_assignment, improving_value, can_improve, selection, choice_values, scores)
+        return MdpOptimalityResult(prop, primary, secondary, improving_assignment, improving_value, can_improve, selection, choice_values, expected_visits, scores)
 
 
     def check_specification(self, specification, property_indices = None, short_evaluation = False):
@@ -85,6 +85,22 @@ class Property:
         ''' check if DTMC model checking result satisfies the property '''
         return self.result_valid(value) and self.meets_threshold(value)
 
+    def decide_bounds(self, primary, secondary):
+        '''
+        Decide the property for any subfamily of a family whose MDP yielded
+        the given values in the primary and the secondary direction: the value
+        of a subfamily is never better than the primary one and never worse
+        than the secondary one.
+        :return True if all subfamilies satisfy the property, False if none
+          does, None if undecided
+        '''
+        if primary is not None and self.result_valid(primary) and not self.meets_threshold(primary):
+            return False
+        # a lower bound on a maximizing reward might become infinite
+        if secondary is not None and self.satisfies_threshold(secondary) and not (self.reward and not self.minimizing):
+            return True
+        return None
+
     @property
     def is_until(self):
         return self.formula.subformula.is_until_formula
@@ -147,6 +163,18 @@ class OptimalityProperty(Property):
     def improves_optimum(self, value):
         return self.result_valid(value) and self.meets_op(value, self.optimum)
 
+    def decide_bounds(self, primary, secondary):
+        '''
+        Same as for constraints, but decided wrt the current optimum.
+        :return True if all subfamilies improve the optimum, False if none
+          does, None if undecided
+        '''
+        if primary is not None and self.result_valid(primary) and not self.meets_op(primary, self.optimum):
+            return False
+        if secondary is not None and self.improves_optimum(secondary) and not (self.reward and not self.minimizing):
+            return True
+        return None
+
     def update_optimum(self, optimum):
         # assert self.improves_optimum(optimum)
         logger.debug(f"New opt = {optimum}.")
@@ -264,6 +292,7 @@ def construct_reward_property(reward_name, minimizing, target_label):
 
 class PropertyResult:
     def __init__(self, prop, result, value):
+        self.prop = prop
         self.result = result
         self.value = value
         self.sat = prop.satisfies_threshold(value)
@@ -375,6 +404,12 @@ class MdpPropertyResult:
         self.primary_expected_visits = primary_expected_visits
         self.primary_scores = primary_scores
 
+    def bounds(self):
+        ''' :return values of the primary and the secondary direction (None if not computed) '''
+        primary = self.primary.value if self.primary is not None else None
+        secondary = self.secondary.value if self.secondary is not None else None
+        return primary,secondary
+
     def __str__(self):
         prim = str(self.primary)
         seco = str(self.secondary)
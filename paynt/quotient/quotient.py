@@ -5,17 +5,100 @@ from .holes import Hole,Holes,DesignSpace
 from .models import MarkovChain,MDP,DTMC
 from .coloring import MdpColoring
 
+from collections import OrderedDict
 import math
 import itertools
+import numpy
 
 import logging
 logger = logging.getLogger(__name__)
 
 
+class ModelCache:
+    '''
+    Bounded LRU cache of restricted quotient models. An entry is a triple
+    (model, state_map, choice_map) and is keyed by the signature of the family
+    (tuple of option masks) that determined the selection of actions.
+    '''
+
+    def __init__(self, budget):
+        # memory budget (in bytes)
+        self.budget = budget
+        # estimated memory occupied by the entries
+        self.size = 0
+        # key -> (entry, entry size), ordered from the least recently used
+        self.entries = OrderedDict()
+
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def entry_size(model, state_map, choice_map):
+        ''' Rough estimate of the memory (in bytes) occupied by the entry. '''
+        return model.nr_transitions * 16 + model.nr_choices * 8 + (len(state_map) + len(choice_map)) * 36
+
+    def clear(self):
+        self.entries.clear()
+        self.size = 0
+
+    def get(self, key):
+        if self.budget == 0:
+            return None
+        item = self.entries.get(key)
+        if item is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.entries.move_to_end(key)
+        return item[0]
+
+    def put(self, key, entry):
+        if self.budget == 0:
+            return
+        entry_size = ModelCache.entry_size(*entry)
+        if entry_size > self.budget or key in self.entries:
+            return
+        while self.size + entry_size > self.budget:
+            _,(_,evicted_size) = self.entries.popitem(last=False)
+            self.size -= evicted_size
+        self.entries[key] = (entry,entry_size)
+        self.size += entry_size
+
+
+
+class InducedChain:
+    '''
+    Sub-model of an MDP induced by a memoryless deterministic scheduler,
+    restricted to the reachable states. It is constructed once and shared by
+    all analyses of the scheduler (selection, expected visits, scoring).
+    '''
+
+    def __init__(self, model, state_map, choice_map):
+        # restricted MDP having a single choice in each state
+        self.model = model
+        # sub- to MDP state and choice mapping
+        self.state_map = numpy.asarray(state_map, dtype=numpy.int64)
+        self.choice_map = numpy.asarray(choice_map, dtype=numpy.int64)
+        self._dtmc = None
+
+    @property
+    def dtmc(self):
+        ''' The induced chain as a DTMC, constructed on demand. '''
+        if self._dtmc is None:
+            self._dtmc = QuotientContainer.mdp_to_dtmc(self.model)
+        return self._dtmc
+
+
 class QuotientContainer:
 
     # if True, export the (labeled) optimal DTMC
     export_optimal_result = False
+    # if True, MDPs of subfamilies are built by restricting the MDP of the
+    # parent family (which is kept in memory until all subfamilies are built)
+    build_incrementally = False
+    # memory budget (in bytes) of the cache of restricted models, 0 disables
+    # caching (families explored by AR rarely recur, CEGIS/hybrid revisit them)
+    model_cache_budget = 0
 
     def __init__(self, quotient_mdp = None, coloring = None,
         specification = None):
@@ -34,6 +117,9 @@ class QuotientContainer:
         # (optional) counter of discarded assignments
         self.discarded = None
 
+        # cache of restricted models
+        self.model_cache = ModelCache(QuotientContainer.model_cache_budget)
+
     def export_result(self, dtmc):
         ''' to be overridden '''
         pass
@@ -63,16 +149,53 @@ class QuotientContainer:
     def restrict_quotient(self, selected_actions_bv):
         return self.restrict_mdp(self.quotient_mdp, selected_actions_bv)        
 
+
+    def restrict_parent(self, family):
+        '''
+        Restrict the MDP of the parent family by removing actions labeled by
+        options of the splitter that are not included in this family.
+        :return (1) the restricted model
+        :return (2) sub- to quotient state mapping
+        :return (3) sub- to quotient action mapping
+        '''
+        pi = family.parent_info
+
+        # locate removed quotient actions in the parent MDP
+        removed_actions = self.coloring.hole_excluded_actions(family, pi.splitter)
+        choice_order = numpy.argsort(pi.quotient_choice_map)
+        sorted_choice_map = pi.quotient_choice_map[choice_order]
+        positions = numpy.searchsorted(sorted_choice_map, removed_actions)
+        positions = numpy.minimum(positions, len(sorted_choice_map)-1)
+        removed_choices = choice_order[positions[sorted_choice_map[positions] == removed_actions]]
+
+        selected_choices_bv = stormpy.BitVector(pi.model.nr_choices, True)
+        for choice in removed_choices.tolist():
+            selected_choices_bv.set(choice, False)
+        model,state_map,choice_map = self.restrict_mdp(pi.model, selected_choices_bv)
+
+        # compose the mappings
+        state_map = pi.quotient_state_map[state_map].tolist()
+        choice_map = pi.quotient_choice_map[choice_map].tolist()
+        return model,state_map,choice_map
+
     
     def build(self, family):
         ''' Construct the quotient MDP for the family. '''
 
         # select actions compatible with the family and restrict the quotient
-        hole_selected_actions,selected_actions,selected_actions_bv = self.coloring.select_actions(family)
-        model,state_map,choice_map = self.restrict_quotient(selected_actions_bv)
+        # (or the MDP of the parent family, if available)
+        selected_actions,selected_actions_bv = self.coloring.select_actions(family)
+        cache_key = ("mdp", family.option_masks)
+        restriction = self.model_cache.get(cache_key)
+        if restriction is None:
+            if family.parent_info is not None and family.parent_info.model is not None:
+                restriction = self.restrict_parent(family)
+            else:
+                restriction = self.restrict_quotient(selected_actions_bv)
+            self.model_cache.put(cache_key, restriction)
+        model,state_map,choice_map = restriction
 
         # cash restriction information
-        family.hole_selected_actions = hole_selected_actions
         family.selected_actions = selected_actions
 
         # encapsulate MDP
@@ -95,40 +218,61 @@ class QuotientContainer:
     def build_chain(self, family):
         assert family.size == 1
 
-        _,_,selected_actions_bv = self.coloring.select_actions(family)
-        mdp,state_map,choice_map = self.restrict_quotient(selected_actions_bv)
-        dtmc = QuotientContainer.mdp_to_dtmc(mdp)
+        cache_key = ("dtmc", family.option_masks)
+        restriction = self.model_cache.get(cache_key)
+        if restriction is None:
+            _,selected_actions_bv = self.coloring.select_actions(family)
+            mdp,state_map,choice_map = self.restrict_quotient(selected_actions_bv)
+            dtmc = QuotientContainer.mdp_to_dtmc(mdp)
+            restriction = (dtmc,state_map,choice_map)
+            self.model_cache.put(cache_key, restriction)
+        dtmc,state_map,choice_map = restriction
 
         return DTMC(dtmc,self,state_map,choice_map)
 
     
-    def scheduler_selection(self, mdp, scheduler):
-        ''' Get hole options involved in the scheduler selection. '''
+    def induced_chain(self, mdp, scheduler):
+        ''' Construct the chain induced by the scheduler in the MDP (reachable states only). '''
         assert scheduler.memoryless and scheduler.deterministic
-        
-        # construct DTMC that corresponds to this scheduler and filter reachable states/choices
         choices = scheduler.compute_action_support(mdp.model.nondeterministic_choice_indices)
-        dtmc,_,choice_map = self.restrict_mdp(mdp.model, choices)
-        choices = [ choice_map[state] for state in range(dtmc.nr_states) ]
+        model,state_map,choice_map = self.restrict_mdp(mdp.model, choices)
+        return InducedChain(model, state_map, choice_map)
+
+
+    def scheduler_selection(self, mdp, scheduler, chain = None):
+        '''
+        Get hole options involved in the scheduler selection.
+        :param chain induced by the scheduler, will be constructed if not provided
+        '''
+        if chain is None:
+            chain = self.induced_chain(mdp, scheduler)
         
         # map relevant choices to hole options
-        selection = [set() for hole_index in mdp.design_space.hole_indices]
-        for choice in choices:
-            global_choice = mdp.quotient_choice_map[choice]
-            choice_options = self.coloring.action_to_hole_options[global_choice]
-            for hole_index,option in choice_options.items():
-                selection[hole_index].add(option)
-        selection = [list(options) for options in selection]
+        coloring = self.coloring
+        quotient_choices = numpy.asarray(mdp.quotient_choice_map, dtype=numpy.int64)[chain.choice_map]
+        labels,_ = coloring.choice_labels(quotient_choices)
+        hole_options = numpy.unique(coloring.label_hole_option[labels])
+        holes = numpy.searchsorted(coloring.hole_option_offsets, hole_options, side="right") - 1
+        options = hole_options - coloring.hole_option_offsets[holes]
+        hole_offsets = numpy.searchsorted(holes, numpy.arange(mdp.design_space.num_holes+1)).tolist()
+        options = options.tolist()
+        selection = [
+            options[hole_offsets[hole_index]:hole_offsets[hole_index+1]]
+            for hole_index in mdp.design_space.hole_indices
+        ]
 
         return selection    
 
     
     @staticmethod
     def make_vector_defined(vector):
-        vector_noinf = [ value if value != math.inf else 0 for value in vector]
-        default_value = sum(vector_noinf) / len(vector)
-        vector_valid = [ value if value != math.inf else default_value for value in vector]
-        return vector_valid
+        ''' Replace infinite values with the average of the vector (infinite values counting as 0). '''
+        vector = numpy.array(vector, dtype=numpy.float64)
+        infinite = vector == math.inf
+        if infinite.any():
+            vector[infinite] = 0
+            vector[infinite] = vector.sum() / len(vector)
+        return vector
 
     
     def choice_values(self, mdp, prop, result):
@@ -153,105 +297,97 @@ class QuotientContainer:
             rm = mdp.model.reward_models.get(reward_name)
             assert not rm.has_transition_rewards and (rm.has_state_rewards != rm.has_state_action_rewards)
             if rm.has_state_action_rewards:
-                choice_rewards = list(rm.state_action_rewards)
+                choice_rewards = numpy.array(rm.state_action_rewards, dtype=numpy.float64)
                 assert mdp.choices == len(choice_rewards)
-                for choice in range(mdp.choices):
-                    choice_values[choice] += choice_rewards[choice]
+                choice_values += choice_rewards
             else:
-                state_rewards = list(rm.state_rewards)
+                state_rewards = numpy.array(rm.state_rewards, dtype=numpy.float64)
                 assert mdp.states == len(state_rewards)
-                tm = mdp.model.transition_matrix
-                for state in range(mdp.states):
-                    for choice in range(tm.get_row_group_start(state),tm.get_row_group_end(state)):
-                        choice_values[choice] += state_rewards[state]
+                row_groups = numpy.asarray(mdp.model.nondeterministic_choice_indices, dtype=numpy.int64)
+                choice_values += numpy.repeat(state_rewards, numpy.diff(row_groups))
 
         # sanity check
-        for choice in range(mdp.choices):
-            assert not math.isnan(choice_values[choice])
+        assert not numpy.isnan(choice_values).any()
 
         return choice_values
 
 
-    def expected_visits(self, mdp, prop, scheduler):
+    def expected_visits(self, mdp, prop, scheduler, chain = None):
         '''
         Compute expected number of visits in the states of DTMC induced by
         this scheduler.
+        :param chain induced by the scheduler, will be constructed if not provided
         '''
-
-        # extract DTMC induced by this MDP-scheduler
-        choices = scheduler.compute_action_support(mdp.model.nondeterministic_choice_indices)
-        sub_mdp,state_map,_ = self.restrict_mdp(mdp.model, choices)
-        dtmc = QuotientContainer.mdp_to_dtmc(sub_mdp)
+        if chain is None:
+            chain = self.induced_chain(mdp, scheduler)
 
         # compute visits
-        dtmc_visits = stormpy.synthesis.compute_expected_number_of_visits(MarkovChain.environment, dtmc).get_values()
-        dtmc_visits = list(dtmc_visits)
+        dtmc_visits = stormpy.synthesis.compute_expected_number_of_visits(MarkovChain.environment, chain.dtmc).get_values()
+        dtmc_visits = numpy.array(dtmc_visits, dtype=numpy.float64)
 
         # handle infinity- and zero-visits
         if prop.minimizing:
             dtmc_visits = QuotientContainer.make_vector_defined(dtmc_visits)
         else:
-            dtmc_visits = [ value if value != math.inf else 0 for value in dtmc_visits]
+            dtmc_visits[dtmc_visits == math.inf] = 0
 
         # map vector of expected visits onto the state space of the quotient MDP
-        expected_visits = [0] * mdp.states
-        for state in range(dtmc.nr_states):
-            mdp_state = state_map[state]
-            visits = dtmc_visits[state]
-            expected_visits[mdp_state] = visits
+        expected_visits = numpy.zeros(mdp.states, dtype=numpy.float64)
+        expected_visits[chain.state_map] = dtmc_visits
 
         return expected_visits
 
 
     def estimate_scheduler_difference(self, mdp, inconsistent_assignments, choice_values, expected_visits):
+        '''
+        For each inconsistent hole, compute the average (over the states where
+        this hole is inconsistent) difference between the maximum and the
+        minimum value of choices labeled by inconsistent options, weighted by
+        the expected number of visits of the state.
+        '''
+        coloring = self.coloring
+        num_holes = max(coloring.holes.num_holes,1)
+
+        # gather labels of the choices of this MDP
+        quotient_choice_map = numpy.asarray(mdp.quotient_choice_map, dtype=numpy.int64)
+        labels,labels_per_choice = coloring.choice_labels(quotient_choice_map)
+        label_mdp_choice = numpy.repeat(numpy.arange(mdp.choices), labels_per_choice)
+        row_groups = numpy.asarray(mdp.model.nondeterministic_choice_indices, dtype=numpy.int64)
+        choice_to_state = numpy.repeat(numpy.arange(mdp.states), numpy.diff(row_groups))
+
+        # keep labels by inconsistent hole options
+        inconsistent_hole_options = numpy.array([
+            coloring.hole_option_offsets[hole_index] + option
+            for hole_index,options in inconsistent_assignments.items() for option in options
+        ], dtype=numpy.int64)
+        relevant = numpy.isin(coloring.label_hole_option[labels], inconsistent_hole_options)
+        label_mdp_choice = label_mdp_choice[relevant]
+        label_hole = coloring.label_hole[labels[relevant]]
+
+        # group labels by state-hole pairs (ordered by state) and compute the
+        # range of choice values within each group
+        label_state = choice_to_state[label_mdp_choice]
+        label_value = numpy.asarray(choice_values, dtype=numpy.float64)[label_mdp_choice]
+        label_key = label_state * num_holes + label_hole
+        order = numpy.argsort(label_key, kind="stable")
+        label_key = label_key[order]
+        label_value = label_value[order]
+        new_group = numpy.ones(len(label_key), dtype=bool)
+        new_group[1:] = label_key[1:] != label_key[:-1]
+        group_start = numpy.flatnonzero(new_group)
+        group_state = label_key[group_start] // num_holes
+        group_hole = label_key[group_start] % num_holes
+        if len(group_start) > 0:
+            group_min = numpy.minimum.reduceat(label_value, group_start)
+            group_max = numpy.maximum.reduceat(label_value, group_start)
+        else:
+            group_min = group_max = numpy.zeros(0)
+        difference = (group_max - group_min) * numpy.asarray(expected_visits, dtype=numpy.float64)[group_state]
+        assert not numpy.isnan(difference).any()
 
-        # for each hole, compute its difference sum and a number of affected states
-        hole_difference_sum = {hole_index: 0 for hole_index in inconsistent_assignments}
-        hole_states_affected = {hole_index: 0 for hole_index in inconsistent_assignments}
-        tm = mdp.model.transition_matrix
-        
-        for state in range(mdp.states):
-
-            # for this state, compute for each inconsistent hole the difference in choice values between respective options
-            hole_min = {hole_index: None for hole_index in inconsistent_assignments}
-            hole_max = {hole_index: None for hole_index in inconsistent_assignments}
-
-            for choice in range(tm.get_row_group_start(state),tm.get_row_group_end(state)):
-                
-                choice_global = mdp.quotient_choice_map[choice]
-                if self.coloring.default_actions.get(choice_global):
-                    continue
-
-                choice_options = self.coloring.action_to_hole_options[choice_global]
-
-                # collect holes in which this action is inconsistent
-                inconsistent_holes = []
-                for hole_index,option in choice_options.items():
-                    inconsistent_options = inconsistent_assignments.get(hole_index,set())
-                    if option in inconsistent_options:
-                        inconsistent_holes.append(hole_index)
-
-                value = choice_values[choice]
-                for hole_index in inconsistent_holes:
-                    current_min = hole_min[hole_index]
-                    if current_min is None or value < current_min:
-                        hole_min[hole_index] = value
-                    current_max = hole_max[hole_index]
-                    if current_max is None or value > current_max:
-                        hole_max[hole_index] = value
-
-            # compute the difference
-            for hole_index,min_value in hole_min.items():
-                if min_value is None:
-                    continue
-                max_value = hole_max[hole_index]
-                difference = (max_value - min_value) * expected_visits[state]
-                assert not math.isnan(difference)
-                    
-                hole_difference_sum[hole_index] += difference
-                hole_states_affected[hole_index] += 1
-
-        # aggregate
+        # aggregate (groups of each hole are summed in the order of states)
+        hole_difference_sum = numpy.bincount(group_hole, weights=difference, minlength=num_holes).tolist()
+        hole_states_affected = numpy.bincount(group_hole, minlength=num_holes).tolist()
         inconsistent_differences = {
             hole_index: (hole_difference_sum[hole_index] / hole_states_affected[hole_index])
             for hole_index in inconsistent_assignments
@@ -269,14 +405,15 @@ class QuotientContainer:
         scheduler = result.scheduler
 
         # get qualitative scheduler selection, filter inconsistent assignments
-        selection = self.scheduler_selection(mdp, scheduler)
+        chain = self.induced_chain(mdp, scheduler)
+        selection = self.scheduler_selection(mdp, scheduler, chain)
         inconsistent_assignments = {hole_index:options for hole_index,options in enumerate(selection) if len(options) > 1 }
         if len(inconsistent_assignments) == 0:
             return selection,None,None,None
         
         # extract choice values, compute expected visits and estimate scheduler difference
         choice_values = self.choice_values(mdp, prop, result)
-        expected_visits = self.expected_visits(mdp, prop, result.scheduler)
+        expected_visits = self.expected_visits(mdp, prop, scheduler, chain)
         inconsistent_differences = self.estimate_scheduler_difference(mdp, inconsistent_assignments, choice_values, expected_visits)
 
         return selection,choice_values,expected_visits,inconsistent_differences
@@ -399,10 +536,17 @@ class QuotientContainer:
         
         family.splitter = splitter
         parent_info = family.collect_parent_info(self.specification)
+        if incomplete_search and new_design_space.option_masks != family.option_masks:
+            # simple holes were generalized, subfamilies differ from the parent
+            # not only in the splitter: select actions from scratch
+            parent_info.selected_actions = None
+        elif QuotientContainer.build_incrementally:
+            parent_info.model = mdp.model
+            parent_info.quotient_state_map = numpy.array(mdp.quotient_state_map, dtype=numpy.int64)
+            parent_info.quotient_choice_map = numpy.array(mdp.quotient_choice_map, dtype=numpy.int64)
         for suboption in suboptions:
             subholes = new_design_space.subholes(splitter, suboption)
             design_subspace = DesignSpace(subholes, parent_info)
-            design_subspace.assume_hole_options(splitter, suboption)
             design_subspaces.append(design_subspace)
 
         return design_subspaces
@@ -246,7 +246,7 @@ class POMDPQuotientContainer(QuotientContainer):
                 if mem < max(ds[hole].options):
                     new_options += [mem+1]
                 print(new_options)
-                ds[hole].assume_options(new_options)
+                ds.assume_hole_options(hole, new_options)
                 print(ds[hole])
                 print()
         self.design_space = ds
@@ -404,6 +404,7 @@ class POMDPQuotientContainer(QuotientContainer):
 
         self.coloring = MdpColoring(self.quotient_mdp, all_holes, action_to_hole_options)
         self.design_space = DesignSpace(all_holes)
+        self.model_cache.clear()
 
     
 
@@ -531,7 +532,7 @@ class POMDPQuotientContainer(QuotientContainer):
                 for action in actions:
                     for update in updates:
                         options.append(action * num_updates + update)
-                restricted_family[hole].assume_options(options)
+                restricted_family.assume_hole_options(hole, options)
 
         # print(restricted_family)
         logger.debug("Symmetry breaking: reduced design space from {} to {}".format(family.size, restricted_family.size))
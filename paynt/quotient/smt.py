@@ -1,10 +1,13 @@
 import stormpy.synthesis
 
-import z3
+from .enumerator import CubeEnumerator
+
 import sys
 
-# import pycvc5 if installed
+# import z3 and pycvc5 if installed
 import importlib
+if importlib.util.find_spec('z3') is not None:
+    import z3
 if importlib.util.find_spec('pycvc5') is not None:
     import pycvc5
 
@@ -13,55 +16,38 @@ logger = logging.getLogger(__name__)
 
 
 class FamilyEncoding():
+    '''
+    Restriction of the SMT solver to a family: the family is expressed by
+    solver assumptions, i.e. by activation literals of the holes whose options
+    were restricted (see SmtSolver.activation_literal). The literals are
+    obtained from the solver with each query, such that the encoding stays
+    valid when the solver is compacted.
+    '''
 
     def __init__(self, smt_solver, family):
 
         self.smt_solver = smt_solver
         self.family = family
 
-        # for each hole, a formula encoding its possible options
-        self.hole_clauses = None
-        # SMT formula describing the family
-        self.encoding = None
         # set to False as soon as pick_assignment returns None
         self.has_assignments = True
 
-        hole_clauses = []
-        for hole_index,hole in enumerate(family):
-            all_clauses = smt_solver.solver_clauses[hole_index]
-            clauses = [all_clauses[option] for option in hole.options]
-            if len(clauses) == 1:
-                or_clause = clauses[0]
-            else:
-                if smt_solver.use_python_z3:
-                    or_clause = z3.Or(clauses)
-                elif smt_solver.use_cvc:
-                    smt_solver = smt_solver.solver.mkTerm(pycvc5.Kind.Or, clauses)
-                else:
-                    pass
-            hole_clauses.append(or_clause)
-
-        if len(hole_clauses) == 1:
-            encoding = hole_clauses[0]
-        else:
-            if smt_solver.use_python_z3:
-                encoding = z3.And(hole_clauses)
-            elif smt_solver.use_cvc:
-                encoding = smt_solver.solver.mkTerm(pycvc5.Kind.And, hole_clauses)
-            else:
-                pass
 
-        self.hole_clauses = hole_clauses
-        self.encoding = encoding
+    def assumptions(self):
+        return [
+            self.smt_solver.activation_literal(hole_index, hole.mask)
+            for hole_index,hole in enumerate(self.family)
+            if hole.mask != self.smt_solver.full_masks[hole_index]
+        ]
 
 
     def pick_assignment(self):
-        
+
         if not self.has_assignments:
             return None
-        
+
         if self.smt_solver.use_python_z3:
-            solver_result = self.smt_solver.solver.check(self.encoding)
+            solver_result = self.smt_solver.solver.check(*self.assumptions())
             if solver_result == z3.unsat:
                 self.has_assignments = False
                 return None
@@ -71,7 +57,7 @@ class FamilyEncoding():
                 option = sat_model[var].as_long()
                 hole_options.append([option])
         elif self.smt_solver.use_cvc:
-            solver_result = self.smt_solver.solver.checkSatAssuming(self.encoding)
+            solver_result = self.smt_solver.solver.checkSatAssuming(*self.assumptions())
             if solver_result.isUnsat():
                 self.has_assignments = False
                 return None
@@ -79,16 +65,44 @@ class FamilyEncoding():
             for hole_index,var in enumerate(self.smt_solver.solver_vars):
                 option = self.smt_solver.solver.getValue(var).getIntegerValue()
                 hole_options.append([option])
+        elif self.smt_solver.use_native:
+            options = self.smt_solver.solver.pick_assignment(self.family)
+            if options is None:
+                self.has_assignments = False
+                return None
+            hole_options = [[option] for option in options]
         else:
-            pass            
-        
+            pass
+
         assignment = self.family.copy()
         assignment.assume_options(hole_options)
 
         return assignment
 
-        
+
 class SmtSolver():
+    '''
+    Enumeration of hole assignments that were not excluded by conflicts.
+    Terms describing a hole restricted to a set of options are cached and
+    reused by all families and conflicts. Families restrict the solver using
+    activation literals: literal a(h,S) implies that hole h takes an option
+    from set S, its definition is asserted in the scope where it was first
+    needed. Excluded conflicts are also kept in a conflict store (as cubes,
+    i.e. per-hole option masks, organized in scopes, see CubeEnumerator) from
+    which the solver is rebuilt once the number of its assertions exceeds a
+    threshold, dropping definitions of literals that are no longer used.
+    Before a conflict reaches the solver, it is dropped if the store contains
+    a cube including it; cubes of the current scope included in the new
+    conflict are removed from the store (and from the solver once it is
+    rebuilt).
+    '''
+
+    # backend: "z3", "cvc5" or "native" (see CubeEnumerator), None picks
+    # CVC5 if installed, Z3 if installed, the native enumerator otherwise
+    backend = None
+    # number of assertions beyond which the solver is rebuilt from the
+    # conflict store (if at least half of the assertions can be dropped)
+    compaction_threshold = 10000
 
     def __init__(self, family):
 
@@ -97,28 +111,58 @@ class SmtSolver():
         # SMT solver choice
         self.use_python_z3 = False
         self.use_cvc = False
-    
+        self.use_native = False
+
         # for each hole contains a corresponding solver variable
         self.solver_vars = None
         # for each hole contains a list of equalities [h==opt1,h==opt2,...],
         #   where h is the corresponding solver variable
         self.solver_clauses = None
+        # for each hole, the mask of all its options
+        self.full_masks = [(1 << len(hole.option_labels)) - 1 for hole in family]
 
         # current depth of push/pop solving
         self.solver_depth = 0
 
+        # cache of terms: (hole index, option mask) -> disjunction of equalities
+        self.hole_terms = {}
+        # activation literals: (hole index, option mask) -> literal
+        self.activation_literals = {}
+        # for each scope, keys of the activation literals defined in it
+        self.scope_literals = [[]]
+        # conflict store
+        self.conflict_store = CubeEnumerator(family)
+        # for each scope, the number of assertions
+        self.scope_assertions = [0]
+        # number of times the solver was rebuilt
+        self.compactions = 0
+        # number of conflicts dropped because an excluded cube included them
+        self.conflicts_redundant = 0
+        # number of excluded cubes removed because a new conflict included them
+        self.conflicts_subsumed = 0
+
         # choose solver
-        if "pycvc5" in sys.modules:
+        backend = SmtSolver.backend
+        if backend is None:
+            if "pycvc5" in sys.modules:
+                backend = "cvc5"
+            elif "z3" in sys.modules:
+                backend = "z3"
+            else:
+                backend = "native"
+        if backend == "cvc5":
             logger.debug("Using CVC5 for SMT solving.")
             self.use_cvc = True
-        else:
+        elif backend == "z3":
             logger.debug("Using Python Z3 for SMT solving.")
             self.use_python_z3 = True
+        elif backend == "native":
+            logger.debug("Using the native enumerator instead of SMT solving.")
+            self.use_native = True
 
         # create solver, solver variables
         self.solver_clauses = []
         if self.use_python_z3:
-            self.solver = z3.Solver()
             self.solver_vars = [z3.Int(hole_index) for hole_index in family.hole_indices]
         elif self.use_cvc:
             self.solver = pycvc5.Solver()
@@ -131,6 +175,11 @@ class SmtSolver():
             # self.solver.setLogic("QF_UFLIA")
             intSort = self.solver.getIntegerSort()
             self.solver_vars = [self.solver.mkConst(intSort, str(hole_index)) for hole_index in family.hole_indices]
+        elif self.use_native:
+            # the conflict store enumerates the assignments
+            self.solver = self.conflict_store
+            self.solver_vars = []
+            return
         else:
             raise RuntimeError("Need to enable at least one SMT solver.")
 
@@ -141,6 +190,8 @@ class SmtSolver():
             clauses = [self.create_hole_clause(hole_index,option) for option in hole.options]
             self.solver_clauses.append(clauses)
 
+        self.create_solver()
+
 
     def create_hole_clause(self, hole_index, option):
         var = self.solver_vars[hole_index]
@@ -152,6 +203,100 @@ class SmtSolver():
             return None
 
 
+    def create_solver(self):
+        ''' Create a fresh solver asserting the domains of the holes. '''
+        if self.use_python_z3:
+            self.solver = z3.Solver()
+        elif self.use_cvc:
+            self.solver.resetAssertions()
+        for hole_index,full_mask in enumerate(self.full_masks):
+            self.add(self.hole_term(hole_index, full_mask))
+
+
+    def mk_or(self, terms):
+        if len(terms) == 1:
+            return terms[0]
+        if self.use_python_z3:
+            return z3.Or(terms)
+        elif self.use_cvc:
+            return self.solver.mkTerm(pycvc5.Kind.Or, terms)
+
+    def mk_and(self, terms):
+        if len(terms) == 1:
+            return terms[0]
+        if self.use_python_z3:
+            return z3.And(terms)
+        elif self.use_cvc:
+            return self.solver.mkTerm(pycvc5.Kind.And, terms)
+
+    def mk_not(self, term):
+        if self.use_python_z3:
+            return z3.Not(term)
+        elif self.use_cvc:
+            return term.notTerm()
+
+    def mk_false(self):
+        if self.use_python_z3:
+            return z3.BoolVal(False)
+        elif self.use_cvc:
+            return self.solver.mkFalse()
+
+    def add(self, term):
+        if self.use_python_z3:
+            self.solver.add(term)
+        elif self.use_cvc:
+            self.solver.assertFormula(term)
+        self.scope_assertions[-1] += 1
+
+
+    def hole_term(self, hole_index, mask):
+        ''' Term stating that the hole takes one of the options in the mask. '''
+        key = (hole_index, mask)
+        term = self.hole_terms.get(key)
+        if term is None:
+            clauses = self.solver_clauses[hole_index]
+            options = [option for option in range(len(clauses)) if mask >> option & 1]
+            term = self.mk_or([clauses[option] for option in options])
+            self.hole_terms[key] = term
+        return term
+
+
+    def activation_literal(self, hole_index, mask):
+        ''' Literal implying that the hole takes one of the options in the mask. '''
+        key = (hole_index, mask)
+        literal = self.activation_literals.get(key)
+        if literal is None:
+            name = f"a_{hole_index}_{mask}"
+            if self.use_python_z3:
+                literal = z3.Bool(name)
+                self.add(z3.Implies(literal, self.hole_term(hole_index, mask)))
+            elif self.use_cvc:
+                literal = self.solver.mkConst(self.solver.getBooleanSort(), name)
+                self.add(self.solver.mkTerm(pycvc5.Kind.Implies, literal, self.hole_term(hole_index, mask)))
+            self.activation_literals[key] = literal
+            self.scope_literals[-1].append(key)
+        return literal
+
+
+    def push(self):
+        self.conflict_store.push()
+        if self.use_native:
+            return
+        self.solver.push()
+        self.scope_literals.append([])
+        self.scope_assertions.append(0)
+
+    def pop(self):
+        self.conflict_store.pop()
+        if self.use_native:
+            return
+        self.solver.pop()
+        # definitions of the literals were removed with the scope
+        for key in self.scope_literals.pop():
+            del self.activation_literals[key]
+        self.scope_assertions.pop()
+
+
     def pick_assignment(self, family):
         '''
         :return unexplored hole assignment from the family
@@ -160,6 +305,31 @@ class SmtSolver():
         family.encode(self)
         return family.encoding.pick_assignment()
 
+    def pick_assignments(self, family, num_assignments):
+        '''
+        Pick pairwise distinct unexplored hole assignments from the family:
+        each picked assignment is excluded in a temporary scope.
+        :return a list of at most num_assignments assignments (empty if no
+          instance remains)
+        '''
+        if num_assignments == 1:
+            assignment = self.pick_assignment(family)
+            return [] if assignment is None else [assignment]
+
+        family.encode(self)
+        assignments = []
+        self.push()
+        while len(assignments) < num_assignments:
+            assignment = family.encoding.pick_assignment()
+            if assignment is None:
+                break
+            assignments.append(assignment)
+            self.exclude_conflict(family, assignment, family.hole_indices)
+        self.pop()
+        # the family was exhausted only if no assignment was picked
+        family.encoding.has_assignments = len(assignments) > 0
+        return assignments
+
     def pick_assignment_priority(self, family, priority_subfamily):
 
         if priority_subfamily is None:
@@ -172,8 +342,8 @@ class SmtSolver():
 
         # explore remaining members
         return self.pick_assignment(family)
-    
-    
+
+
     def exclude_conflicts(self, family, assignment, conflicts):
         '''
         :param conflicts a list of conflicts (may be empty)
@@ -182,9 +352,10 @@ class SmtSolver():
         pruning_estimate = 0
         for conflict in conflicts:
             pruning_estimate += self.exclude_conflict(family, assignment, conflict)
+        self.compact()
         return pruning_estimate
-    
-    
+
+
     def exclude_conflict(self, family, assignment, conflict):
         '''
         Exclude assignment from the family encoding using provided conflict.
@@ -194,41 +365,75 @@ class SmtSolver():
         :return estimate of pruned assignments
         '''
         assert family.encoding is not None
-        
+
         if family.encoding is None:
             family.encoding = FamilyEncoding(self, family)
 
         pruning_estimate = 1
-        counterexample_clauses = []
-        for hole_index,var in enumerate(self.solver_vars):
+        cube = []
+        for hole_index,hole in enumerate(family):
             if hole_index in conflict:
-                option = assignment[hole_index].options[0]
-                counterexample_clauses.append(self.solver_clauses[hole_index][option])
+                cube.append(assignment[hole_index].mask)
             else:
-                if not family[hole_index].is_unrefined:
-                    counterexample_clauses.append(family.encoding.hole_clauses[hole_index])
-                pruning_estimate *= family[hole_index].size
+                cube.append(hole.mask)
+                pruning_estimate *= hole.size
 
-        if self.use_python_z3:
-            if len(counterexample_clauses) == 0:
-                counterexample_encoding = False
-            else:
-                counterexample_encoding = z3.Not(z3.And(counterexample_clauses))
-            self.solver.add(counterexample_encoding)
-        elif self.use_cvc:
-            if len(counterexample_clauses) == 0:
-                counterexample_encoding = self.solver.mkFalse()
-            elif len(counterexample_clauses) == 1:
-                counterexample_encoding = counterexample_clauses[0].notTerm()
-            else:
-                counterexample_encoding = self.solver.mkTerm(pycvc5.Kind.And, counterexample_clauses).notTerm()
-            self.solver.assertFormula(counterexample_encoding)
-        else:
-            pass
+        if self.conflict_store.including_cubes(cube):
+            self.conflicts_redundant += 1
+            return 0
+        subsumed = self.conflict_store.included_cubes(cube)
+        if subsumed:
+            self.conflicts_subsumed += bin(subsumed).count("1")
+            self.conflict_store.remove(subsumed)
+
+        self.conflict_store.exclude(cube)
+        if not self.use_native:
+            self.add(self.cube_encoding(cube))
 
         return pruning_estimate
 
 
+    def cube_encoding(self, cube):
+        ''' Formula excluding the cube. '''
+        clauses = [
+            self.hole_term(hole_index, mask)
+            for hole_index,mask in enumerate(cube)
+            if mask != self.full_masks[hole_index]
+        ]
+        if len(clauses) == 0:
+            return self.mk_false()
+        return self.mk_not(self.mk_and(clauses))
+
+
+    def compact(self):
+        '''
+        Rebuild the solver from the conflict store if it holds too many
+        assertions: definitions of activation literals are dropped and are
+        recreated on demand.
+        '''
+        if self.use_native:
+            return
+        num_assertions = sum(self.scope_assertions)
+        scope_cubes = self.conflict_store.scope_cubes()
+        num_cubes = sum(len(cubes) for cubes in scope_cubes)
+        if num_assertions <= SmtSolver.compaction_threshold or num_assertions <= 2 * (num_cubes + len(self.full_masks)):
+            return
+        logger.debug(f"compacting the SMT solver: {num_assertions} assertions, {num_cubes} conflicts")
+
+        self.activation_literals = {}
+        self.scope_literals = [[]]
+        self.scope_assertions = [0]
+        self.create_solver()
+        for depth,cubes in enumerate(scope_cubes):
+            if depth > 0:
+                self.solver.push()
+                self.scope_literals.append([])
+                self.scope_assertions.append(0)
+            for cube in cubes:
+                self.add(self.cube_encoding(cube))
+        self.compactions += 1
+
+
     def level(self, refinement_depth):
         ''' Reset solver depth level to correspond to refinement level. '''
 
@@ -238,10 +443,9 @@ class SmtSolver():
 
         # reset to the scope of the parent (refinement_depth - 1)
         while self.solver_depth >= refinement_depth:
-            self.solver.pop()
+            self.pop()
             self.solver_depth -= 1
 
         # create new scope
-        self.solver.push()
+        self.push()
         self.solver_depth += 1
-
@@ -575,7 +575,7 @@ class StormPOMDPControl:
                     options.append(action)
                 if len(options) == 0:
                     options = [0]
-                restricted_family[hole].assume_options(options)
+                restricted_family.assume_hole_options(hole, options)
 
             # Apply memory restrictions
             #for index in range(mem_num_holes):
@@ -584,7 +584,7 @@ class StormPOMDPControl:
             #    options = []
             #    for update in updates:
             #        options.append(update)
-            #    restricted_family[hole].assume_options(options)
+            #    restricted_family.assume_hole_options(hole, options)
 
         #print(restricted_family)
         logger.info("Main family based on data from Storm: reduced design space from {} to {}".format(family.size, restricted_family.size))
@@ -609,7 +609,7 @@ class StormPOMDPControl:
                 if len(selected_actions) == 0:
                     return None
 
-                restricted_family[hole].assume_options(selected_actions)
+                restricted_family.assume_hole_options(hole, selected_actions)
 
         #print(restricted_family)
         logger.info("Main family based on data from Storm: reduced design space from {} to {}".format(family.size, restricted_family.size))
@@ -738,10 +738,10 @@ class StormPOMDPControl:
             if len(actions) == 0:
                 actions = [family[restrictions[i]["hole"]].options[0]]
 
-            restricted_family[restrictions[i]['hole']].assume_options(actions)
+            restricted_family.assume_hole_options(restrictions[i]['hole'], actions)
 
             for j in range(i):
-                restricted_family[restrictions[j]['hole']].assume_options(restrictions[j]["restriction"])
+                restricted_family.assume_hole_options(restrictions[j]['hole'], restrictions[j]["restriction"])
 
             subfamilies.append(restricted_family)
 
@@ -0,0 +1,298 @@
+import multiprocessing as mp
+import os
+import pickle
+import time
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+def design_space_fingerprint(design_space):
+    ''' Names, numbers of options and options of the holes, used to check that a journal belongs to the design space. '''
+    return tuple((hole.name, len(hole.option_labels), hole.mask) for hole in design_space)
+
+
+class JournalState:
+    '''
+    State of the synthesis described by the records of a journal: pending
+    families, exclusions and the best assignment.
+    '''
+
+    def __init__(self):
+        # fingerprint of the design space the journal was recorded for
+        self.fingerprint = None
+        # compact forms of pending families, indexed by their option masks
+        self.pending = {}
+        self.assignment = None
+        self.optimum = None
+        self.explored = 0
+        self.excluded = []
+        # number of replayed records
+        self.num_records = 0
+
+    def apply(self, record):
+        ''' Update the state by the record. '''
+        self.num_records += 1
+        kind = record[0]
+        if kind == "design_space":
+            self.fingerprint = record[1]
+        elif kind == "family":
+            compact = record[1]
+            self.pending[compact[0]] = compact
+        elif kind == "done":
+            self.pending.pop(record[1], None)
+            self.explored = record[2]
+        elif kind == "assignment":
+            self.assignment = record[1]
+            self.optimum = record[2]
+        elif kind == "excluded":
+            self.excluded.append(record[1])
+            self.explored = record[2]
+        elif kind == "snapshot":
+            _,pending,self.assignment,self.optimum,self.explored,excluded = record
+            self.pending = {compact[0]:compact for compact in pending}
+            self.excluded = list(excluded)
+
+    def snapshot_records(self):
+        ''' Records describing this state. '''
+        return [
+            ("design_space", self.fingerprint),
+            ("snapshot", list(self.pending.values()), self.assignment, self.optimum, self.explored, self.excluded)
+        ]
+
+    @classmethod
+    def replay(cls, path, size = None):
+        '''
+        Replay the journal (up to the given size).
+        :return the state and the size of the valid prefix of the journal
+        '''
+        state = cls()
+        valid_size = 0
+        with open(path, "rb") as journal:
+            while size is None or valid_size < size:
+                try:
+                    record = pickle.load(journal)
+                except (EOFError, pickle.UnpicklingError, ValueError, TypeError):
+                    break
+                valid_size = journal.tell()
+                state.apply(record)
+        return state, valid_size
+
+
+def write_snapshot(path, size, snapshot_path):
+    '''
+    Replay the prefix of the journal and write the snapshot of its state (in
+    a separate process, see Checkpoint.compact).
+    '''
+    state,_ = JournalState.replay(path, size)
+    with open(snapshot_path, "wb") as snapshot:
+        for record in state.snapshot_records():
+            pickle.dump(record, snapshot, protocol=pickle.HIGHEST_PROTOCOL)
+        snapshot.flush()
+        os.fsync(snapshot.fileno())
+
+
+class Checkpoint:
+    '''
+    Append-only journal of the synthesis progress. Families are recorded in
+    their compact form (see DesignSpace.to_compact) when they are pushed to
+    the frontier and marked as done once they are explored or split, such
+    that the pending families are exactly the ones not marked as done.
+    Records are buffered and appended to the journal periodically; the
+    search itself only counts them. Once the journal holds many more records
+    than there are pending families and exclusions, it is compacted: a
+    separate process replays the journal and writes a snapshot of the state,
+    the records appended meanwhile are copied after the snapshot and the
+    result atomically replaces the journal. The journal starts with the
+    fingerprint of the design space. When resuming, the journal is replayed
+    and the search continues from the pending families; a partially written
+    last record is discarded. Without a journal path, all methods do nothing.
+    '''
+
+    # path to the journal, None disables checkpointing
+    path = None
+    # period (in seconds) of appending buffered records to the journal
+    period = 60
+    # whether to resume synthesis from the journal
+    resume = False
+    # the journal is compacted once the number of records since the last
+    # snapshot exceeds this many times the size of the state (and 1000)
+    compaction_ratio = 4
+
+    def __init__(self, design_space):
+        # design space used to reconstruct recorded families
+        self.design_space = design_space
+        self.fingerprint = design_space_fingerprint(design_space)
+
+        # state restored from the journal (see JournalState), None if not resuming
+        self.state = None
+        self.resumed = False
+
+        # number of pending families and exclusions described by the journal
+        self.num_pending = 0
+        self.num_excluded = 0
+        # number of records in the journal
+        self.journal_records = 0
+        self.buffer = []
+        self.last_flush = time.perf_counter()
+        self.journal = None
+        # running compaction: the process, the size of the journal and the
+        #   number of records when it started
+        self.compaction = None
+        if Checkpoint.path is None:
+            return
+
+        if Checkpoint.resume and os.path.isfile(Checkpoint.path):
+            self.state, valid_size = JournalState.replay(Checkpoint.path)
+            if self.state.num_records > 0 and self.state.fingerprint != self.fingerprint:
+                raise ValueError(f"the checkpoint journal {Checkpoint.path} was recorded for a different design space")
+            # the journal contains more than the fingerprint
+            self.resumed = self.state.num_records > 1
+            self.num_pending = len(self.state.pending)
+            self.num_excluded = len(self.state.excluded)
+            self.journal_records = self.state.num_records
+            self.journal = open(Checkpoint.path, "r+b")
+            self.journal.truncate(valid_size)
+            self.journal.seek(valid_size)
+            logger.info(f"resuming from {Checkpoint.path}: {self.num_pending} pending families, {self.num_excluded} excluded subfamilies")
+        else:
+            self.journal = open(Checkpoint.path, "wb")
+        if self.journal_records == 0:
+            self.record(("design_space", self.fingerprint))
+
+    @property
+    def enabled(self):
+        return self.journal is not None
+
+    def restore(self, synthesizer, family):
+        '''
+        Restore the state of the synthesizer.
+        :param family the explored design space
+        :return families to explore
+        :return the best assignment found so far (or None)
+        '''
+        if not self.resumed:
+            self.family_pushed(family)
+            return [family], None
+
+        synthesizer.explored = self.state.explored
+        assignment = None
+        if self.state.assignment is not None:
+            assignment = self.design_space.from_compact((self.state.assignment, 0, family.property_indices, None))
+        if self.state.optimum is not None:
+            synthesizer.quotient.specification.optimality.update_optimum(self.state.optimum)
+        families = [self.design_space.from_compact(compact) for compact in self.state.pending.values()]
+        # the families are now owned by the synthesizer
+        self.state.pending = {}
+        return families, assignment
+
+    def replay_exclusions(self, smt_solver):
+        ''' Exclude subfamilies recorded in the journal from the SMT encoding. '''
+        if not self.resumed:
+            return
+        for option_masks in self.state.excluded:
+            family = self.design_space.from_compact((option_masks, 0, None, None))
+            family.encode(smt_solver)
+            smt_solver.exclude_conflict(family, None, [])
+        self.state.excluded = []
+
+    def record(self, record):
+        kind = record[0]
+        if kind == "family":
+            self.num_pending += 1
+        elif kind == "done":
+            self.num_pending -= 1
+        elif kind == "excluded":
+            self.num_excluded += 1
+        self.buffer.append(record)
+        if time.perf_counter() - self.last_flush >= Checkpoint.period:
+            self.flush()
+
+    def flush(self):
+        if not self.enabled:
+            return
+        for record in self.buffer:
+            pickle.dump(record, self.journal, protocol=pickle.HIGHEST_PROTOCOL)
+        self.journal.flush()
+        self.journal_records += len(self.buffer)
+        self.buffer = []
+        self.last_flush = time.perf_counter()
+
+        if self.compaction is not None:
+            if not self.compaction[0].is_alive():
+                self.finish_compaction()
+            return
+        state_size = max(self.num_pending, 0) + self.num_excluded + 1
+        if self.journal_records > max(Checkpoint.compaction_ratio * state_size, 1000):
+            self.compact()
+
+    def compact(self):
+        ''' Start writing the snapshot of the journal in a separate process. '''
+        size = self.journal.tell()
+        process = mp.Process(target=write_snapshot, args=(Checkpoint.path, size, Checkpoint.path + ".tmp"), daemon=True)
+        process.start()
+        self.compaction = (process, size, self.journal_records)
+
+    def finish_compaction(self):
+        '''
+        Append the records written since the compaction started to the
+        snapshot and let it replace the journal.
+        '''
+        process,size,journal_records = self.compaction
+        self.compaction = None
+        process.join()
+        snapshot_path = Checkpoint.path + ".tmp"
+        if process.exitcode != 0:
+            logger.warning("failed to compact the checkpoint journal")
+            if os.path.isfile(snapshot_path):
+                os.remove(snapshot_path)
+            return
+        with open(Checkpoint.path, "rb") as journal, open(snapshot_path, "ab") as snapshot:
+            journal.seek(size)
+            snapshot.write(journal.read())
+            snapshot.flush()
+            os.fsync(snapshot.fileno())
+        self.journal.close()
+        os.replace(snapshot_path, Checkpoint.path)
+        self.journal = open(Checkpoint.path, "ab")
+        # the snapshot consists of two records
+        self.journal_records = 2 + self.journal_records - journal_records
+
+    def close(self):
+        if not self.enabled:
+            return
+        self.flush()
+        if self.compaction is not None:
+            self.finish_compaction()
+        self.journal.close()
+        self.journal = None
+
+    def family_pushed(self, family):
+        if not self.enabled:
+            return
+        self.record(("family", family.to_compact()))
+
+    def family_done(self, family, explored):
+        if not self.enabled:
+            return
+        self.record(("done", family.option_masks, explored))
+
+    def assignment_found(self, assignment, optimum):
+        if not self.enabled:
+            return
+        self.record(("assignment", assignment.option_masks, optimum))
+
+    def conflicts_excluded(self, family, assignment, conflicts, explored):
+        '''
+        Record subfamilies excluded by the conflicts: holes in a conflict are
+        fixed to the options of the assignment, the other ones range over the
+        family.
+        '''
+        if not self.enabled:
+            return
+        for conflict in conflicts:
+            option_masks = tuple(
+                assignment[hole_index].mask if hole_index in conflict else hole.mask
+                for hole_index,hole in enumerate(family)
+            )
+            self.record(("excluded", option_masks, explored))
@@ -0,0 +1,238 @@
+import collections
+import heapq
+import itertools
+import os
+import pickle
+import tempfile
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+class Frontier:
+    '''
+    Collection of families pending for analysis. Each family is pushed
+    together with its priority (a higher priority means that the family is
+    explored sooner), which is ignored by uninformed frontiers.
+    '''
+
+    def push(self, family, priority = 0):
+        ''' to be overridden '''
+        pass
+
+    def pop(self):
+        ''' to be overridden '''
+        pass
+
+    def __len__(self):
+        ''' to be overridden '''
+        pass
+
+    def __bool__(self):
+        return len(self) > 0
+
+    def push_all(self, families, priorities):
+        for family,priority in zip(families,priorities):
+            self.push(family, priority)
+
+
+class StackFrontier(Frontier):
+    ''' Depth-first search. '''
+
+    def __init__(self):
+        self.families = []
+
+    def push(self, family, priority = 0):
+        self.families.append(family)
+
+    def pop(self):
+        return self.families.pop(-1)
+
+    def __len__(self):
+        return len(self.families)
+
+
+class QueueFrontier(Frontier):
+    ''' Breadth-first search. '''
+
+    def __init__(self):
+        self.families = collections.deque()
+
+    def push(self, family, priority = 0):
+        self.families.append(family)
+
+    def pop(self):
+        return self.families.popleft()
+
+    def __len__(self):
+        return len(self.families)
+
+
+class HeapFrontier(Frontier):
+    '''
+    Best-first search using a binary heap: both push and pop take O(log n).
+    Ties are broken in favour of recently pushed families (as in DFS).
+    '''
+
+    def __init__(self):
+        self.heap = []
+        self.counter = itertools.count()
+
+    def push(self, family, priority = 0):
+        # heapq is a min-heap: negate the priority, a decreasing counter
+        # prefers recently pushed families and avoids comparing families
+        heapq.heappush(self.heap, (-priority, -next(self.counter), family))
+
+    def pop(self):
+        return heapq.heappop(self.heap)[2]
+
+    def __len__(self):
+        return len(self.heap)
+
+
+class HybridFrontier(Frontier):
+    '''
+    Best-first search with diving: subfamilies of the last explored family
+    are explored depth-first until the dive depth is reached, then the
+    remaining families are returned to the heap and the best family is
+    picked.
+    '''
+
+    # maximum number of consecutive depth-first steps
+    dive_depth = 8
+
+    def __init__(self):
+        self.heap = HeapFrontier()
+        self.dive = []
+        self.dive_steps = 0
+
+    def push(self, family, priority = 0):
+        self.dive.append((family,priority))
+
+    def pop(self):
+        if self.dive and self.dive_steps < HybridFrontier.dive_depth:
+            self.dive_steps += 1
+            return self.dive.pop(-1)[0]
+        for family,priority in self.dive:
+            self.heap.push(family, priority)
+        self.dive = []
+        self.dive_steps = 0
+        return self.heap.pop()
+
+    def __len__(self):
+        return len(self.heap) + len(self.dive)
+
+
+class SpillingFrontier(Frontier):
+    '''
+    DFS or BFS frontier keeping a bounded window of families in memory. Cold
+    families are serialized in their compact form (see
+    DesignSpace.to_compact) into segments appended to a temporary log file
+    and paged back in as the in-memory window drains, such that the order of
+    exploration is preserved. Spilled families lose their parent info.
+    '''
+
+    # maximum number of families kept in memory, 0 disables spilling
+    window_size = 0
+    # directory for the log file (None uses the system default)
+    spill_dir = None
+
+    def __init__(self, design_space, lifo = True):
+        # design space used to reconstruct the spilled families
+        self.design_space = design_space
+        # if True, families are explored depth-first, otherwise breadth-first
+        self.lifo = lifo
+
+        # families to be explored next
+        self.head = collections.deque()
+        # (BFS only) families pushed after some family was spilled
+        self.tail = []
+        # (offset, length, number of families) of the spilled segments in
+        # the order of exploration
+        self.segments = collections.deque()
+        self.num_spilled = 0
+        self.log = None
+
+        # total number of families spilled to disk
+        self.spilled = 0
+
+    def __len__(self):
+        return len(self.head) + len(self.tail) + self.num_spilled
+
+    def write_segment(self, families):
+        if self.log is None:
+            self.log = tempfile.TemporaryFile(prefix="paynt-frontier-", dir=SpillingFrontier.spill_dir)
+        data = pickle.dumps([family.to_compact() for family in families], protocol=pickle.HIGHEST_PROTOCOL)
+        self.log.seek(0, os.SEEK_END)
+        offset = self.log.tell()
+        self.log.write(data)
+        self.num_spilled += len(families)
+        self.spilled += len(families)
+        return (offset, len(data), len(families))
+
+    def read_segment(self, segment):
+        offset,length,num_families = segment
+        self.log.seek(offset)
+        compact_families = pickle.loads(self.log.read(length))
+        self.num_spilled -= num_families
+        if self.lifo or not self.segments:
+            # the segment was at the end of the log, reclaim the space
+            self.log.truncate(offset if self.lifo else 0)
+        return [self.design_space.from_compact(compact) for compact in compact_families]
+
+    def spill(self):
+        chunk = max(SpillingFrontier.window_size // 2, 1)
+        if self.lifo:
+            # spill the oldest families of the stack
+            families = [self.head.popleft() for _ in range(min(chunk,len(self.head)))]
+            self.segments.append(self.write_segment(families))
+        elif len(self.tail) >= chunk or not self.head:
+            # spill the families pushed most recently
+            self.segments.append(self.write_segment(self.tail))
+            self.tail = []
+        else:
+            # spill the newest families of the head, these precede all spilled ones
+            families = [self.head.pop() for _ in range(min(chunk,len(self.head)))]
+            families.reverse()
+            self.segments.appendleft(self.write_segment(families))
+
+    def push(self, family, priority = 0):
+        if self.lifo or (not self.segments and not self.tail):
+            self.head.append(family)
+        else:
+            self.tail.append(family)
+        if len(self.head) + len(self.tail) > SpillingFrontier.window_size:
+            self.spill()
+
+    def pop(self):
+        if not self.head:
+            if self.lifo:
+                self.head.extend(self.read_segment(self.segments.pop()))
+            elif self.segments:
+                self.head.extend(self.read_segment(self.segments.popleft()))
+            else:
+                self.head.extend(self.tail)
+                self.tail = []
+        if self.lifo:
+            return self.head.pop()
+        return self.head.popleft()
+
+
+def make_frontier(frontier_type, design_space):
+    '''
+    Create an empty frontier of the given type.
+    :param design_space used to reconstruct families spilled to disk
+    '''
+    if SpillingFrontier.window_size > 0:
+        if frontier_type in ["dfs","bfs"]:
+            return SpillingFrontier(design_space, lifo = (frontier_type == "dfs"))
+        logger.warning(f"spilling families to disk is not supported for the '{frontier_type}' frontier")
+    if frontier_type == "dfs":
+        return StackFrontier()
+    if frontier_type == "bfs":
+        return QueueFrontier()
+    if frontier_type == "best":
+        return HeapFrontier()
+    if frontier_type == "hybrid":
+        return HybridFrontier()
+    raise ValueError(f"unknown frontier type {frontier_type}")
@@ -1,4 +1,5 @@
 from ..utils.profiler import Timer
+from ..quotient.models import MarkovChain
 
 import logging
 logger = logging.getLogger(__name__)
@@ -35,6 +36,16 @@ class Statistic:
         self.iterations_mdp = 0
         self.acc_size_mdp = 0
         self.avg_size_mdp = 0
+        self.families_decided_by_bounds = 0
+
+        self.splits = 0
+        self.acc_split_families = 0
+        self.acc_parent_info_bytes = 0
+
+        # SMT solver of CEGIS, set by the synthesizer
+        self.smt_solver = None
+        # AR/CEGIS stage control of the hybrid synthesizer
+        self.stage_control = None
 
         self.feasible = None
         self.assignment = None
@@ -57,6 +68,18 @@ class Statistic:
         self.acc_size_mdp += size_mdp
         self.print_status()
 
+    def family_decided_by_bounds(self):
+        self.families_decided_by_bounds += 1
+        self.print_status()
+
+    def family_split(self, subfamilies):
+        ''' Record memory retained by the parent info shared by the new subfamilies. '''
+        if not subfamilies or subfamilies[0].parent_info is None:
+            return
+        self.splits += 1
+        self.acc_split_families += len(subfamilies)
+        self.acc_parent_info_bytes += subfamilies[0].parent_info.retained_bytes()
+
     
     def status(self):
         discarded = self.quotient.discarded if self.quotient.discarded is not None else 0
@@ -80,7 +103,10 @@ class Statistic:
         # elif ds.use_python_z3:
         #     sat_size = len(ds.solver.assertions())
 
-        return f"> Progress {percentage_rejected}%, elapsed {time_elapsed} s, iters = {iters}, opt = {optimum}"
+        status = f"> Progress {percentage_rejected}%, elapsed {time_elapsed} s, iters = {iters}, opt = {optimum}"
+        if self.stage_control is not None:
+            status += f", CEGIS/AR = {round(self.stage_control.cegis_efficiency,2)}"
+        return status
 
     def print_status(self):
         if not self.synthesis_time.read() > self.status_horizon:
@@ -124,8 +150,35 @@ class Statistic:
         cegis_stats = f"CEGIS stats: avg DTMC size: {round(self.avg_size_dtmc)}, iterations: {self.iterations_dtmc}"
         if self.iterations_mdp > 0:
             family_stats += f"{ar_stats}\n"
+        if self.families_decided_by_bounds > 0:
+            family_stats += f"families decided by parent bounds: {self.families_decided_by_bounds}\n"
         if self.iterations_dtmc > 0:
             family_stats += f"{cegis_stats}\n"
+        model_cache = self.quotient.model_cache
+        if model_cache.hits + model_cache.misses > 0:
+            family_stats += f"model cache: {model_cache.hits} hits, {model_cache.misses} misses\n"
+        if MarkovChain.checks_warm > 0:
+            cold = safe_division(MarkovChain.timer_cold.read(), MarkovChain.checks_cold) * 1000
+            warm = safe_division(MarkovChain.timer_warm.read(), MarkovChain.checks_warm) * 1000
+            family_stats += f"MDP model checking: {MarkovChain.checks_cold} cold (avg {round(cold,2)} ms), {MarkovChain.checks_warm} warm-started (avg {round(warm,2)} ms)\n"
+        if MarkovChain.count_iterations and MarkovChain.checks_cold + MarkovChain.checks_warm > 0:
+            cold = safe_division(MarkovChain.iterations_cold, MarkovChain.checks_cold)
+            warm = safe_division(MarkovChain.iterations_warm, MarkovChain.checks_warm)
+            family_stats += f"MDP solver iterations: avg {round(cold,1)} cold, avg {round(warm,1)} warm-started\n"
+        if self.splits > 0:
+            parent_info_bytes = safe_division(self.acc_parent_info_bytes, self.acc_split_families)
+            family_stats += f"parent info: avg {round(parent_info_bytes)} B retained per pending family\n"
+        stage_control = self.stage_control
+        if stage_control is not None:
+            throughput_ar = safe_division(stage_control.pruned["ar"], stage_control.timer_ar.read())
+            throughput_cegis = safe_division(stage_control.pruned["cegis"], stage_control.timer_cegis.read())
+            family_stats += f"stage control: AR pruned {round(throughput_ar)}/s, CEGIS pruned {round(throughput_cegis)}/s, " \
+                f"CEGIS/AR time ratio {round(stage_control.cegis_efficiency,2)} (range {round(stage_control.efficiency_min,2)}-{round(stage_control.efficiency_max,2)})\n"
+        smt_solver = self.smt_solver
+        if smt_solver is not None and smt_solver.conflicts_redundant + smt_solver.conflicts_subsumed > 0:
+            family_stats += f"conflicts: {smt_solver.conflicts_redundant} redundant, {smt_solver.conflicts_subsumed} subsumed\n"
+        if smt_solver is not None and smt_solver.compactions > 0:
+            family_stats += f"SMT solver compactions: {smt_solver.compactions}\n"
 
         feasible = "yes" if self.feasible else "no"
         result = f"feasible: {feasible}" if self.optimum is None else f"optimal: {round(self.optimum, 6)}"
@@ -1,4 +1,5 @@
 from .statistic import Statistic
+from .checkpoint import Checkpoint
 
 import logging
 logger = logging.getLogger(__name__)
@@ -13,6 +14,7 @@ class Synthesizer:
         self.quotient = quotient
         self.stat = Statistic(self)
         self.explored = 0
+        self.checkpoint = None
     
     @property
     def method_name(self):
@@ -27,7 +29,9 @@ class Synthesizer:
         if family is None:
             family = self.quotient.design_space
         
+        self.checkpoint = Checkpoint(family)
         assignment = self.synthesize_assignment(family)
+        self.checkpoint.close()
 
         self.stat.finished(assignment)
         return assignment
@@ -59,3 +63,8 @@ class Synthesizer:
     def explore(self, family):
         self.explored += family.size
 
+    def current_optimum(self):
+        if not self.quotient.specification.has_optimality:
+            return None
+        return self.quotient.specification.optimality.optimum
+
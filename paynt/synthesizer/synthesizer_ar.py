@@ -1,4 +1,7 @@
 from .synthesizer import Synthesizer
+from .frontier import make_frontier
+
+import math
 
 import logging
 logger = logging.getLogger(__name__)
@@ -6,13 +9,28 @@ logger = logging.getLogger(__name__)
 
 class SynthesizerAR(Synthesizer):
 
+    # order in which families are explored: dfs, bfs, best or hybrid
+    frontier_type = "dfs"
+    # priority of families in informed frontiers: value, gap or size
+    frontier_key = "value"
+
     @property
     def method_name(self):
         return "AR"
 
     
     def verify_family(self, family):
+        # bounds of the parent family (wrt the current optimum) might suffice
+        res = family.check_parent_bounds(self.quotient.specification)
+        if res is not None:
+            family.parent_info = None
+            self.stat.family_decided_by_bounds()
+            family.analysis_result = res
+            return
+
         self.quotient.build(family)
+        # parent info is no longer needed, release it
+        family.parent_info = None
         self.stat.iteration_mdp(family.mdp.states)
         res = family.mdp.check_specification(self.quotient.specification, property_indices = family.property_indices, short_evaluation = True)
         family.analysis_result = res
@@ -36,73 +54,60 @@ class SynthesizerAR(Synthesizer):
         if ur.minimizing:
             value *= -1
         return value
+
+    def family_priority(self, family, parent):
+        '''
+        :return priority of an unexplored subfamily in the frontier, computed
+          from the analysis of its parent (a higher priority is explored sooner)
+        '''
+        key = SynthesizerAR.frontier_key
+        if key == "size":
+            # prefer small families
+            return -family.size
+        if key == "gap":
+            # prefer families with wide bounds; unless the secondary direction
+            # was computed, the primary bound is compared to the threshold it
+            # has to meet (for optimality, derived from the current optimum)
+            result = parent.analysis_result.undecided_result()
+            primary,secondary = result.bounds()
+            if secondary is not None:
+                return abs(secondary - primary)
+            threshold = result.primary.prop.threshold
+            if math.isinf(threshold):
+                # no optimum yet
+                return self.family_value(parent)
+            return abs(threshold - primary)
+        return self.family_value(parent)
     
     def synthesize_assignment(self, family):
 
         self.quotient.discarded = 0
 
-        satisfying_assignment = None
-        families = [family]
+        initial_families,satisfying_assignment = self.checkpoint.restore(self, family)
+        families = make_frontier(SynthesizerAR.frontier_type, family)
+        for initial_family in initial_families:
+            families.push(initial_family)
 
         while families:
 
-            family = families.pop(-1)
-            family.parent_info = None
+            family = families.pop()
 
             self.verify_family(family)
             can_improve,improving_assignment = self.analyze_family(family)
             if improving_assignment is not None:
                 satisfying_assignment = improving_assignment
+                self.checkpoint.assignment_found(improving_assignment, self.current_optimum())
             if can_improve == False:
                 self.explore(family)
+                self.checkpoint.family_done(family, self.explored)
                 continue
 
             # undecided
             subfamilies = self.quotient.split(family, Synthesizer.incomplete_search)
-            families = families + subfamilies
-
-        return satisfying_assignment
-
-
-    def synthesize_assignment_experimental(self, family):
-
-        self.quotient.discarded = 0
-
-        satisfying_assignment = None
-        families = [family]
-        while families:
-
-            # analyze all families, keep optimal solution
-            for family in families:
-                if family.analysis_result is not None:
-                    continue
-                family.parent_info = None
-                self.verify_family(family)
-                _,improving_assignment = self.analyze_family(family)
-                if improving_assignment is not None:
-                    satisfying_assignment = improving_assignment
-            
-            # analyze families once more and keep undecided ones
-            undecided_families = []
-            for family in families:
-                can_improve,_ = self.analyze_family(family)
-                if can_improve == False:
-                    self.explore(family)
-                else:
-                    undecided_families.append(family)
-            if not undecided_families:
-                break
-            
-            # sort families
-            undecided_families = sorted(undecided_families, key=lambda f: self.family_value(f), reverse=True)
-            # print([self.family_value(f) for f in undecided_families])
-
-            # split family with the best value
-            family = undecided_families[0]
-            subfamilies = self.quotient.split(family, Synthesizer.incomplete_search)
-            families = subfamilies + undecided_families[1:]
-                
+            self.stat.family_split(subfamilies)
+            for subfamily in subfamilies:
+                self.checkpoint.family_pushed(subfamily)
+            self.checkpoint.family_done(family, self.explored)
+            families.push_all(subfamilies, [self.family_priority(subfamily, family) for subfamily in subfamilies])
 
         return satisfying_assignment
-
-
@@ -5,15 +5,82 @@ from ..quotient.smt import SmtSolver
 from .conflict_generator.storm import ConflictGeneratorStorm
 from .conflict_generator.switss import ConflictGeneratorSwitss
 from .conflict_generator.mdp import ConflictGeneratorMdp
+from .synthesizer_multicore_ar import prepare_workers, release_workers, load_quotient
+
+import os
 
 import logging
 logger = logging.getLogger(__name__)
 
 
+# global variables of a worker process analyzing batched assignments, set by
+# the worker initializer
+# the synthesizer reconstructed from the quotient snapshot (see load_quotient)
+worker_synthesizer = None
+# the explored family (with its quotient MDP)
+worker_family = None
+# the snapshot, keeps the shared memory mapped
+worker_snapshot = None
+# exception raised during the initialization
+worker_error = None
+
+
+def initialize_worker(quotient_snapshot, compact_family, conflict_generator_type):
+    global worker_synthesizer, worker_family, worker_snapshot, worker_error
+    worker_snapshot = quotient_snapshot
+    try:
+        quotient = load_quotient(worker_snapshot)
+        SynthesizerCEGIS.conflict_generator_type = conflict_generator_type
+        worker_synthesizer = SynthesizerCEGIS(quotient)
+        worker_family = quotient.design_space.from_compact(compact_family)
+        quotient.build(worker_family)
+        worker_synthesizer.conflict_generator.initialize()
+    except Exception as e:
+        # the worker reports the error when analyzing its first assignment
+        logger.exception("Worker sub-process failed to initialize.")
+        worker_error = e
+
+
+def analyze_assignment(args):
+    '''
+    Analyze the assignment (in a worker process), see
+    SynthesizerCEGIS.analyze_family_assignment_cegis.
+    :param args the option masks of the assignment and the current optimum
+    :return list of conflicts
+    :return option masks of the accepting assignment (or None)
+    :return the optimum after the analysis
+    :return size of the DTMC
+    '''
+    if worker_error is not None:
+        raise worker_error
+    try:
+        option_masks, optimum = args
+        specification = worker_synthesizer.quotient.specification
+        if optimum is not None and specification.optimality.meets_op(optimum, specification.optimality.optimum):
+            specification.optimality.update_optimum(optimum)
+
+        assignment = worker_family.from_compact((option_masks, 0, None, None))
+        size_dtmc = worker_synthesizer.stat.acc_size_dtmc
+        conflicts, accepting_assignment = worker_synthesizer.analyze_family_assignment_cegis(worker_family, assignment)
+        size_dtmc = worker_synthesizer.stat.acc_size_dtmc - size_dtmc
+
+        if accepting_assignment is not None:
+            accepting_assignment = accepting_assignment.option_masks
+        conflicts = [list(conflict) for conflict in conflicts]
+        return (conflicts, accepting_assignment, worker_synthesizer.current_optimum(), size_dtmc)
+    except:
+        logger.exception("Worker sub-process encountered an error.")
+        raise
+
+
+
 class SynthesizerCEGIS(Synthesizer):
 
     # CLI argument selecting conflict generator
     conflict_generator_type = None
+    # number of distinct assignments picked in each round and analyzed in
+    # parallel, 1 disables batching
+    batch_size = 1
 
     def __init__(self, quotient):
         super().__init__(quotient)
@@ -112,6 +179,52 @@ class SynthesizerCEGIS(Synthesizer):
         return conflicts, accepting_assignment
 
 
+    def start_workers(self, family, context, quotient_snapshot):
+        '''
+        Create a pool of processes analyzing batched assignments of the family,
+        each worker reconstructs the quotient (see prepare_workers).
+        '''
+        return context.Pool(
+            processes = SynthesizerCEGIS.num_workers(), initializer = initialize_worker,
+            initargs = (quotient_snapshot, family.to_compact(), SynthesizerCEGIS.conflict_generator_type)
+        )
+
+    @staticmethod
+    def num_workers():
+        return min(SynthesizerCEGIS.batch_size, os.cpu_count())
+
+
+    def analyze_assignments(self, family, assignments, pool):
+        '''
+        Analyze a batch of assignments: all assignments are model checked
+        wrt the same optimum, improvements are confirmed wrt the optimum
+        updated in the order of the batch.
+        :return for each assignment, the result of analyze_family_assignment_cegis
+        '''
+        if pool is None:
+            return [self.analyze_family_assignment_cegis(family, assignment) for assignment in assignments]
+
+        optimum = self.current_optimum()
+        try:
+            results = pool.map(analyze_assignment, [(assignment.option_masks, optimum) for assignment in assignments])
+        except Exception as e:
+            raise RuntimeError(f"worker sub-process encountered an error: {e!r}") from e
+
+        analyzed = []
+        for result in results:
+            conflicts, accepting_masks, improving_value, size_dtmc = result
+            self.stat.iteration_dtmc(size_dtmc)
+            accepting_assignment = None
+            if accepting_masks is not None:
+                if improving_value is None:
+                    accepting_assignment = family.from_compact((accepting_masks, 0, None, None))
+                elif self.quotient.specification.optimality.improves_optimum(improving_value):
+                    self.quotient.specification.optimality.update_optimum(improving_value)
+                    accepting_assignment = family.from_compact((accepting_masks, 0, None, None))
+            analyzed.append( (conflicts, accepting_assignment) )
+        return analyzed
+
+
     def synthesize_assignment(self, family):
 
         # build the quotient, map mdp states to hole indices
@@ -124,21 +237,43 @@ class SynthesizerCEGIS(Synthesizer):
 
         # use sketch design space as a SAT baseline (TODO why?)
         smt_solver = SmtSolver(self.quotient.design_space)
+        self.stat.smt_solver = smt_solver
         
         # CEGIS loop
-        satisfying_assignment = None
-        assignment = smt_solver.pick_assignment(family)
-        while assignment is not None:
-            
-            conflicts, accepting_assignment = self.analyze_family_assignment_cegis(family, assignment)
-            if accepting_assignment is not None:
-                satisfying_assignment = accepting_assignment
-                if not self.quotient.specification.can_be_improved():
-                    return satisfying_assignment
-
-            pruned = smt_solver.exclude_conflicts(family, assignment, conflicts)
-            self.explored += pruned
-            
-            # construct next assignment
-            assignment = smt_solver.pick_assignment(family)
+        families,satisfying_assignment = self.checkpoint.restore(self, family)
+        if not families:
+            # the family was explored before the checkpoint
+            return satisfying_assignment
+        self.checkpoint.replay_exclusions(smt_solver)
+
+        pool = None
+        quotient_snapshot = None
+        try:
+            if SynthesizerCEGIS.batch_size > 1:
+                context,quotient_snapshot = prepare_workers(self.quotient, SynthesizerCEGIS.num_workers())
+                pool = self.start_workers(family, context, quotient_snapshot)
+            assignments = smt_solver.pick_assignments(family, SynthesizerCEGIS.batch_size)
+            while assignments:
+
+                # all conflicts of the batch are excluded before picking the next one
+                for assignment,(conflicts,accepting_assignment) in zip(assignments, self.analyze_assignments(family, assignments, pool)):
+                    if accepting_assignment is not None:
+                        satisfying_assignment = accepting_assignment
+                        self.checkpoint.assignment_found(accepting_assignment, self.current_optimum())
+                        if not self.quotient.specification.can_be_improved():
+                            return satisfying_assignment
+
+                    pruned = smt_solver.exclude_conflicts(family, assignment, conflicts)
+                    self.explored += pruned
+                    self.checkpoint.conflicts_excluded(family, assignment, conflicts, self.explored)
+
+                # construct next assignments
+                assignments = smt_solver.pick_assignments(family, SynthesizerCEGIS.batch_size)
+        finally:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+            if SynthesizerCEGIS.batch_size > 1:
+                release_workers(quotient_snapshot)
+        self.checkpoint.family_done(family, self.explored)
         return satisfying_assignment
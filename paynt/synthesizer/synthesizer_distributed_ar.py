@@ -0,0 +1,296 @@
+from .synthesizer_ar import SynthesizerAR
+from .synthesizer_multicore_ar import SynthesizerMultiCoreAR, explore_subtree, collect_configuration, apply_configuration
+from .frontier import make_frontier
+
+from ..parser.sketch import Sketch
+
+import multiprocessing as mp
+from multiprocessing.connection import Listener, Client, wait
+import ipaddress
+import queue
+import threading
+import time
+
+import logging
+logger = logging.getLogger(__name__)
+
+
+def parse_address(address):
+    ''' Parse an address of the form host:port. '''
+    host,_,port = address.rpartition(":")
+    return (host or "localhost", int(port))
+
+
+def is_loopback(host):
+    ''' Check whether the host refers to the local machine only. '''
+    if host == "localhost":
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+
+def sketch_fingerprint(quotient):
+    '''
+    Names and numbers of options of the holes and the specification, used to
+    check that a worker loaded the same sketch.
+    '''
+    holes = tuple((hole.name, len(hole.option_labels)) for hole in quotient.design_space)
+    return (holes, str(quotient.specification))
+
+
+class WorkerOptimum:
+    '''
+    Optimum known to a worker of the distributed AR: it is adopted from the
+    coordinator with each family, improvements are reported back with the
+    results (same interface as SharedOptimum).
+    '''
+
+    def __init__(self):
+        self.value = None
+
+    def read(self):
+        return self.value
+
+    def propose(self, prop, value):
+        if self.value is not None and not prop.meets_op(value, self.value):
+            return False
+        self.value = value
+        return True
+
+
+def run_worker(address, authkey, quotient = None, sketch_arguments = None):
+    '''
+    Connect to the coordinator and explore the families it sends until it
+    tells the worker to stop.
+    :param quotient the quotient of the sketch, if None, the sketch is
+      loaded using the arguments of Sketch.load_sketch after the
+      configuration of the coordinator was applied, such that the quotient is
+      constructed in the same way (e.g. with the same POMDP memory)
+    '''
+    try:
+        connection = Client(address, authkey=authkey)
+    except (OSError, mp.AuthenticationError) as e:
+        logger.error(f"failed to connect to the coordinator: {e}")
+        return
+    try:
+        _,configuration,fingerprint = connection.recv()
+        apply_configuration(configuration)
+        if quotient is None:
+            try:
+                quotient = Sketch.load_sketch(*sketch_arguments)
+            except Exception as e:
+                logger.exception("Worker failed to load the sketch.")
+                connection.send(("error", f"the worker failed to load the sketch: {e}"))
+                return
+        if fingerprint != sketch_fingerprint(quotient):
+            connection.send(("error", "the worker loaded a different sketch"))
+            return
+        connection.send(("ready",))
+
+        optimum = WorkerOptimum()
+        while True:
+            message = connection.recv()
+            if message[0] == "stop":
+                break
+            _,compact_family,time_limit,optimum.value = message
+            try:
+                result = explore_subtree(quotient, optimum, compact_family, time_limit)
+            except Exception as e:
+                logger.exception("Worker encountered an error.")
+                connection.send(("error", str(e)))
+                break
+            connection.send(("result", result))
+    except EOFError:
+        logger.info("the coordinator closed the connection")
+    finally:
+        connection.close()
+
+
+
+class SynthesizerDistributedAR(SynthesizerMultiCoreAR):
+    '''
+    AR distributed among workers connected to the coordinator over TCP,
+    possibly running on other machines. Each worker loads the sketch itself
+    (from the same paths as the coordinator) using the configuration of the
+    coordinator. The coordinator keeps the
+    frontier and sends each idle worker a family in its compact form along
+    with the current optimum; the worker explores its subtree for a time
+    slice (see explore_subtree) and replies with the improving assignments
+    and the remaining subfamilies. A family assigned to a worker whose
+    connection was lost (or that encountered an error) is returned to the
+    frontier and the worker is dropped.
+    '''
+
+    # address (host,port) the coordinator listens at, port 0 picks a free port
+    address = ("localhost", 0)
+    # key used to authenticate the workers
+    authkey = b"paynt"
+    # number of worker processes started on this machine
+    local_workers = 0
+    # time (in seconds) the coordinator waits for a worker when none is
+    # connected, and a connected worker may spend loading the sketch
+    worker_timeout = 60
+    # arguments of Sketch.load_sketch for the local workers
+    sketch_arguments = None
+
+    @property
+    def method_name(self):
+        return "AR (distributed)"
+
+    def accept_workers(self, listener, workers):
+        ''' Accept connections of the workers, each handshake runs in its own thread. '''
+        fingerprint = sketch_fingerprint(self.quotient)
+        configuration = collect_configuration()
+        while True:
+            try:
+                connection = listener.accept()
+            except mp.AuthenticationError:
+                logger.warning("rejected a worker that failed to authenticate")
+                continue
+            except OSError:
+                # the listener was closed
+                return
+            threading.Thread(target=self.handshake, args=(connection,configuration,fingerprint,workers), daemon=True).start()
+
+    def handshake(self, connection, configuration, fingerprint, workers):
+        '''
+        Send the configuration to the worker and wait until it loads the
+        sketch, ready workers are put into the queue.
+        '''
+        try:
+            connection.send(("hello", configuration, fingerprint))
+            if not connection.poll(SynthesizerDistributedAR.worker_timeout):
+                logger.warning(f"rejected a worker that did not load the sketch within {SynthesizerDistributedAR.worker_timeout} s")
+                connection.close()
+                return
+            reply = connection.recv()
+        except (EOFError, OSError):
+            connection.close()
+            return
+        if reply[0] != "ready":
+            logger.warning(f"rejected a worker: {reply[1]}")
+            connection.close()
+            return
+        workers.put(connection)
+
+    def wait_for_worker(self, workers, processes):
+        '''
+        Wait until a worker is ready.
+        :param processes local worker processes
+        :raises RuntimeError if no worker is ready within the timeout or all
+          local workers terminated
+        '''
+        deadline = time.perf_counter() + SynthesizerDistributedAR.worker_timeout
+        while True:
+            try:
+                return workers.get(timeout=1)
+            except queue.Empty:
+                pass
+            if processes and not any(process.is_alive() for process in processes) and workers.empty():
+                raise RuntimeError("all local workers terminated, see their log for the cause")
+            if time.perf_counter() >= deadline:
+                raise RuntimeError(f"no worker connected within {SynthesizerDistributedAR.worker_timeout} s")
+
+    def synthesize_assignment(self, family):
+
+        self.quotient.discarded = 0
+
+        satisfying_assignment = None
+        design_space = family
+        families = make_frontier(SynthesizerAR.frontier_type, design_space)
+        families.push(family)
+
+        start_time = time.perf_counter()
+
+        specification = self.quotient.specification
+        listener = Listener(SynthesizerDistributedAR.address, authkey=SynthesizerDistributedAR.authkey)
+        host,port = listener.address
+        logger.info(f"waiting for workers at {host}:{port}")
+
+        # connections of ready workers are delivered by the accepting thread
+        new_workers = queue.Queue()
+        threading.Thread(target=self.accept_workers, args=(listener,new_workers), daemon=True).start()
+
+        context = mp.get_context(SynthesizerMultiCoreAR.start_method)
+        processes = [
+            context.Process(target=run_worker, args=(listener.address, SynthesizerDistributedAR.authkey, None, SynthesizerDistributedAR.sketch_arguments))
+            for _ in range(SynthesizerDistributedAR.local_workers)
+        ]
+        for process in processes:
+            process.start()
+
+        idle = []
+        # worker connection -> family it explores
+        assigned = {}
+        try:
+            while families or assigned:
+
+                while True:
+                    try:
+                        idle.append(new_workers.get_nowait())
+                    except queue.Empty:
+                        break
+                if not idle and not assigned:
+                    # no worker available yet
+                    idle.append(self.wait_for_worker(new_workers, processes))
+
+                # keep every worker busy
+                while families and idle:
+                    connection = idle.pop()
+                    family = families.pop()
+                    # when the frontier runs low, return subfamilies immediately
+                    num_workers = len(idle) + len(assigned) + 1
+                    time_limit = SynthesizerMultiCoreAR.local_time if len(families) >= num_workers else 0
+                    try:
+                        connection.send(("family", family.to_compact(specification), time_limit, self.current_optimum()))
+                    except OSError:
+                        families.push(family)
+                        connection.close()
+                        continue
+                    assigned[connection] = family
+
+                # process the results of the workers
+                for connection in wait(list(assigned), timeout=1):
+                    family = assigned.pop(connection)
+                    try:
+                        message = connection.recv()
+                    except (EOFError, OSError):
+                        logger.warning("lost connection to a worker, its family is returned to the frontier")
+                        families.push(family)
+                        connection.close()
+                        continue
+                    if message[0] == "error":
+                        logger.warning(f"a worker encountered an error: {message[1]}, its family is returned to the frontier")
+                        families.push(family)
+                        connection.close()
+                        continue
+                    satisfying_assignment = self.collect_result(message[1], design_space, families) or satisfying_assignment
+                    idle.append(connection)
+        finally:
+            while True:
+                try:
+                    idle.append(new_workers.get_nowait())
+                except queue.Empty:
+                    break
+            for connection in idle + list(assigned):
+                try:
+                    connection.send(("stop",))
+                except OSError:
+                    pass
+                connection.close()
+            listener.close()
+            for process in processes:
+                # workers that did not connect (e.g. still loading the sketch) are terminated
+                process.join(timeout=1)
+                if process.is_alive():
+                    process.terminate()
+                    process.join()
+
+        finish_time = time.perf_counter()
+        total_time = round(finish_time-start_time, 3)
+
+        logger.info("Synthesis finished in {} s (real time).".format(total_time))
+
+        return satisfying_assignment
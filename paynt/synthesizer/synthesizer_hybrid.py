@@ -14,13 +14,21 @@ logger = logging.getLogger(__name__)
 class StageControl:
     '''
     AR-CEGIS adaptivity: switch between ar/cegis, allocate more time to
-    the more efficient method
+    the more efficient method. The efficiency of a method is its throughput,
+    i.e. the number of family members it pruned per second. Throughputs are
+    measured over a sliding window (in CPU time) of recent stages, and within
+    this window CEGIS is allocated the time spent in AR multiplied by the
+    ratio of the throughputs.
     '''
 
     # whether only AR is performed
     only_ar = False
     # whether 1 AR followed by only CEGIS is performed
     only_cegis = False
+    # length (in seconds) of the window over which throughputs are measured
+    window = 10
+    # bound on the ratio of CEGIS time to AR time (and on its inverse)
+    efficiency_bound = 16
 
     def __init__(self):
         # timings
@@ -31,14 +39,81 @@ class StageControl:
         # time_ar * factor = time_cegis
         # =1 is fair, >1 favours cegis, <1 favours ar
         self.cegis_efficiency = 1
-
-    def start_ar(self):
-        self.timer_cegis.stop()
-        self.timer_ar.start()
-
-    def start_cegis(self):
-        self.timer_ar.stop()
-        self.timer_cegis.start()
+        # range of the multiplier during synthesis
+        self.efficiency_min = 1
+        self.efficiency_max = 1
+
+        # running stage: "ar", "cegis" or None
+        self.stage = None
+        # time of the stage method and number of explored members when the stage started
+        self.stage_start = 0
+        self.stage_explored = 0
+        # for each method, stages completed within the window as (end time, duration, pruned)
+        self.stages = {"ar": [], "cegis": []}
+        # for each method, the total number of pruned members
+        self.pruned = {"ar": 0, "cegis": 0}
+
+    def timer(self, stage):
+        return self.timer_ar if stage == "ar" else self.timer_cegis
+
+    def window_time(self, stage):
+        return sum(duration for _,duration,_ in self.stages[stage])
+
+    def throughput(self, stage):
+        ''' Number of members pruned per second within the window, None if the method did not run. '''
+        duration = self.window_time(stage)
+        if duration == 0:
+            return None
+        return sum(pruned for _,_,pruned in self.stages[stage]) / duration
+
+    def adapt(self):
+        ''' Set the multiplier to the ratio of the throughputs. '''
+        throughput_ar = self.throughput("ar")
+        throughput_cegis = self.throughput("cegis")
+        if throughput_ar is None or throughput_cegis is None:
+            return
+        if throughput_ar == 0 and throughput_cegis == 0:
+            return
+        bound = StageControl.efficiency_bound
+        if throughput_ar == 0:
+            efficiency = bound
+        else:
+            efficiency = min(max(throughput_cegis / throughput_ar, 1/bound), bound)
+        if efficiency != self.cegis_efficiency:
+            logger.debug(f"AR prunes {round(throughput_ar)}/s, CEGIS prunes {round(throughput_cegis)}/s: CEGIS/AR time ratio set to {round(efficiency,2)}")
+        self.cegis_efficiency = efficiency
+        self.efficiency_min = min(self.efficiency_min, efficiency)
+        self.efficiency_max = max(self.efficiency_max, efficiency)
+
+    def finish_stage(self, explored):
+        ''' Record the throughput of the running stage and adapt the multiplier. '''
+        if self.stage is None:
+            return
+        timer = self.timer(self.stage)
+        timer.stop()
+        pruned = explored - self.stage_explored
+        self.pruned[self.stage] += pruned
+        now = self.timer_ar.read() + self.timer_cegis.read()
+        self.stages[self.stage].append( (now, timer.read() - self.stage_start, pruned) )
+        self.stage = None
+        for stages in self.stages.values():
+            while stages and stages[0][0] < now - StageControl.window:
+                stages.pop(0)
+        self.adapt()
+
+    def start_stage(self, stage, explored):
+        self.finish_stage(explored)
+        self.stage = stage
+        timer = self.timer(stage)
+        self.stage_start = timer.read()
+        self.stage_explored = explored
+        timer.start()
+
+    def start_ar(self, explored):
+        self.start_stage("ar", explored)
+
+    def start_cegis(self, explored):
+        self.start_stage("cegis", explored)
 
     def cegis_has_time(self):
         """
@@ -53,8 +128,9 @@ class StageControl:
         if StageControl.only_cegis:
             return True
 
-        # whether CEGIS has more time
-        if self.timer_cegis.read() < self.timer_ar.read() * self.cegis_efficiency:
+        # whether CEGIS has more time within the window
+        time_cegis = self.window_time("cegis") + self.timer_cegis.read() - self.stage_start
+        if time_cegis < self.window_time("ar") * self.cegis_efficiency:
             return True
 
         # stop CEGIS
@@ -72,15 +148,17 @@ class SynthesizerHybrid(SynthesizerAR, SynthesizerCEGIS):
 
         self.conflict_generator.initialize()
         smt_solver = SmtSolver(self.quotient.design_space)
+        self.stat.smt_solver = smt_solver
 
         # AR-CEGIS loop
-        satisfying_assignment = None
-        families = [family]
+        families,satisfying_assignment = self.checkpoint.restore(self, family)
+        self.checkpoint.replay_exclusions(smt_solver)
         self.stage_control = StageControl()
+        self.stat.stage_control = self.stage_control
         while families:
 
             # initiate AR analysis
-            self.stage_control.start_ar()
+            self.stage_control.start_ar(self.explored)
             
             # choose family
             family = families.pop(-1)
@@ -93,12 +171,14 @@ class SynthesizerHybrid(SynthesizerAR, SynthesizerCEGIS):
             can_improve,improving_assignment = self.analyze_family(family)
             if improving_assignment is not None:
                 satisfying_assignment = improving_assignment
+                self.checkpoint.assignment_found(improving_assignment, self.current_optimum())
             if can_improve == False:
                 self.explore(family)
+                self.checkpoint.family_done(family, self.explored)
                 continue
 
             # undecided: initiate CEGIS analysis
-            self.stage_control.start_cegis()
+            self.stage_control.start_cegis(self.explored)
 
             # construct priority subfamily that corresponds to primary scheduler
             scheduler_selection = family.analysis_result.optimality_result.primary_selection
@@ -122,19 +202,28 @@ class SynthesizerHybrid(SynthesizerAR, SynthesizerCEGIS):
                 conflicts, accepting_assignment = self.analyze_family_assignment_cegis(family, assignment)
                 pruned = smt_solver.exclude_conflicts(family, assignment, conflicts)
                 self.explored += pruned
+                self.checkpoint.conflicts_excluded(family, assignment, conflicts, self.explored)
 
                 if accepting_assignment is not None:
                     satisfying_assignment = accepting_assignment
+                    self.checkpoint.assignment_found(accepting_assignment, self.current_optimum())
                     if not self.quotient.specification.can_be_improved:
+                        self.stage_control.finish_stage(self.explored)
                         return satisfying_assignment
 
                 # assignment is UNSAT: move on to the next assignment
 
             if family_explored:
+                self.checkpoint.family_done(family, self.explored)
                 continue
         
             subfamilies = self.quotient.split(family, Synthesizer.incomplete_search)
+            self.stat.family_split(subfamilies)
+            for subfamily in subfamilies:
+                self.checkpoint.family_pushed(subfamily)
+            self.checkpoint.family_done(family, self.explored)
             families = families + subfamilies
 
+        self.stage_control.finish_stage(self.explored)
         return satisfying_assignment
 
@@ -1,195 +1,425 @@
-from .statistic import Statistic
+import stormpy
+
 from .synthesizer import Synthesizer
 from .synthesizer_ar import SynthesizerAR
+from .frontier import make_frontier
+
+from ..parser.pomdp_parser import PomdpParser
+from ..quotient.coloring import MdpColoring
+from ..quotient.holes import Holes, DesignSpace
+from ..quotient.models import MarkovChain
+from ..quotient.property import Property, OptimalityProperty, Specification
+from ..quotient.quotient import QuotientContainer, DTMCQuotientContainer
+from ..quotient.quotient_pomdp import POMDPQuotientContainer
 
 import multiprocessing as mp
+from multiprocessing import shared_memory
+import numpy
+import math
 import os
+import queue
+import tempfile
 import time
 
 import logging
 logger = logging.getLogger(__name__)
 
 
-# global variable containing the quotient
-# when a process is spawned (forked), it will inherit this quotient from the parent
-quotient = None
-
-import cProfile, pstats
-profile = None
+# quotient of the coordinator, inherited by worker processes forked without a snapshot
+coordinator_quotient = None
 
+# global variables of a worker process, set by the worker initializer
+# the quotient reconstructed from the snapshot (see load_quotient)
+quotient = None
+# the snapshot, keeps the shared memory mapped (None if the workers are forked)
+snapshot = None
+# optimum shared by all processes
+shared_optimum = None
+# exception raised while loading the quotient
+load_error = None
+
+
+# class attributes (set from the CLI) relevant for the workers
+worker_configuration = [
+    (Synthesizer, ["incomplete_search"]),
+    (QuotientContainer, ["build_incrementally", "model_cache_budget"]),
+    (DesignSpace, ["store_hints", "hint_dtype"]),
+    (MdpColoring, ["bitvectors_memory_budget"]),
+    (Property, ["mc_precision", "float_precision"]),
+    (POMDPQuotientContainer, ["initial_memory_size", "posterior_aware"]),
+]
+
+def collect_configuration():
+    return {
+        (cls,attribute): getattr(cls,attribute)
+        for cls,attributes in worker_configuration for attribute in attributes
+    }
+
+def apply_configuration(configuration):
+    for (cls,attribute),value in configuration.items():
+        setattr(cls, attribute, value)
+
+
+class QuotientSnapshot:
+    '''
+    Serialized quotient from which each worker process reconstructs its own
+    copy, such that workers do not depend on the start method: the quotient
+    MDP is exported to a temporary DRN file, the flat labels of the coloring
+    are placed in a shared memory block that workers map read-only, the
+    specification is stored as formula strings and the configuration (class
+    attributes set from the CLI) is copied. Only the state of
+    QuotientContainer is restored, hence quotients having additional state
+    (POMDP and Dec-POMDP quotients, i.e. their memory and observation maps)
+    are not supported: their workers must be forked (see prepare_workers),
+    which is not possible on platforms supporting the spawn start method only.
+    The memory budget of the hole-option bitvectors is divided among the
+    workers.
+    '''
 
-def solve_family(args):
+    # quotient types whose state is fully restored by the snapshot
+    supported_types = [QuotientContainer, DTMCQuotientContainer]
+
+    def __init__(self, quotient, num_workers = 1):
+        '''
+        :raises ValueError if the quotient or its specification cannot be
+          serialized
+        '''
+        self.quotient_type = type(quotient)
+        if self.quotient_type not in QuotientSnapshot.supported_types:
+            raise ValueError(f"cannot serialize a quotient of type {self.quotient_type.__name__}")
+        self.constraints = [str(prop.property.raw_formula) for prop in quotient.specification.constraints]
+        self.optimality = None
+        if quotient.specification.has_optimality:
+            optimality = quotient.specification.optimality
+            self.optimality = (str(optimality.property.raw_formula), optimality.epsilon)
+        try:
+            # formulae referring to variables or constants of the program cannot be parsed without it
+            self.load_specification()
+        except Exception as e:
+            raise ValueError(f"cannot serialize the specification: {e}")
+
+        self.configuration = collect_configuration()
+        self.configuration[(MdpColoring,"bitvectors_memory_budget")] //= num_workers
+
+        self.block = None
+        handle,self.drn_path = tempfile.mkstemp(prefix="paynt-quotient-", suffix=".drn")
+        os.close(handle)
+        try:
+            stormpy.export_to_drn(quotient.quotient_mdp, self.drn_path)
+            coloring = quotient.coloring
+            self.holes = Holes(coloring.holes)
+            self.num_labels = len(coloring.label_choice)
+            self.block = shared_memory.SharedMemory(create=True, size=max(3*self.num_labels*8, 1))
+            self.block_name = self.block.name
+            self.labels()[:] = [coloring.label_choice, coloring.label_hole, coloring.label_option]
+        except:
+            # remove the partially created snapshot
+            self.release()
+            raise
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["block"] = None
+        return state
+
+    def labels(self):
+        ''' View of the shared memory block: rows are label_choice, label_hole and label_option. '''
+        return numpy.ndarray((3,self.num_labels), dtype=numpy.int64, buffer=self.block.buf)
+
+    def load_specification(self):
+        formulae = self.constraints + ([self.optimality[0]] if self.optimality is not None else [])
+        props = stormpy.parse_properties_without_context(";".join(formulae))
+        constraints = [Property(prop) for prop in props[:len(self.constraints)]]
+        optimality = None
+        if self.optimality is not None:
+            optimality = OptimalityProperty(props[-1], self.optimality[1])
+        return Specification(constraints, optimality)
+
+    def load(self):
+        ''' Reconstruct the quotient (in a worker process). '''
+        apply_configuration(self.configuration)
+
+        self.block = shared_memory.SharedMemory(name=self.block_name)
+        labels = self.labels()
+        labels.flags.writeable = False
+
+        specification = self.load_specification()
+        MarkovChain.initialize(specification)
+        quotient_mdp = PomdpParser.read_pomdp_drn(self.drn_path)
+        coloring = MdpColoring(quotient_mdp, self.holes, labels = tuple(labels))
+        quotient = self.quotient_type.__new__(self.quotient_type)
+        QuotientContainer.__init__(quotient, quotient_mdp, coloring, specification)
+        quotient.design_space = DesignSpace(coloring.holes)
+        return quotient
+
+    def release(self):
+        ''' Remove the snapshot (in the coordinator, after all workers terminated). '''
+        if self.block is not None:
+            self.block.close()
+            self.block.unlink()
+        os.remove(self.drn_path)
+
+
+class SharedOptimum:
     '''
-    Build the quotient, analyze it and, if necessary, split into subfamilies.
+    Optimal value stored in shared memory: workers read it before analyzing
+    each family and update it atomically as soon as they improve it.
     '''
 
+    def __init__(self, optimum = None, context = mp):
+        # NaN represents an unknown optimum
+        self.value = context.Value("d", math.nan if optimum is None else optimum)
+
+    def read(self):
+        with self.value.get_lock():
+            value = self.value.value
+        return None if math.isnan(value) else value
+
+    def propose(self, prop, value):
+        '''
+        Update the optimum if the value improves it (wrt the property).
+        :return True if the optimum was updated
+        '''
+        with self.value.get_lock():
+            current = None if math.isnan(self.value.value) else self.value.value
+            if current is not None and not prop.meets_op(value, current):
+                return False
+            self.value.value = value
+        return True
+
+
+def prepare_workers(quotient, num_workers):
+    '''
+    Snapshot the quotient for worker processes. If the quotient cannot be
+    serialized (see QuotientSnapshot), worker processes are forked and
+    inherit the quotient of the coordinator instead.
+    :return the multiprocessing context of the worker processes
+    :return the snapshot (None if the workers are forked), to be released
+      using release_workers after the workers terminated
+    '''
+    global coordinator_quotient
+    context = mp.get_context(SynthesizerMultiCoreAR.start_method)
     try:
+        quotient_snapshot = QuotientSnapshot(quotient, num_workers)
+    except ValueError as e:
+        if "fork" not in mp.get_all_start_methods():
+            raise ValueError(f"{e} and worker processes cannot be forked on this platform") from e
+        logger.info(f"{e}, worker processes will be forked")
+        coordinator_quotient = quotient
+        return mp.get_context("fork"), None
+    return context, quotient_snapshot
+
+def release_workers(quotient_snapshot):
+    global coordinator_quotient
+    coordinator_quotient = None
+    if quotient_snapshot is not None:
+        quotient_snapshot.release()
+
+def load_quotient(quotient_snapshot):
+    ''' Reconstruct the quotient in a worker process (see prepare_workers). '''
+    if quotient_snapshot is None:
+        return coordinator_quotient
+    return quotient_snapshot.load()
+
+
+def initialize_worker(quotient_snapshot, optimum):
+    global quotient, snapshot, shared_optimum, load_error
+    snapshot = quotient_snapshot
+    shared_optimum = optimum
+    try:
+        quotient = load_quotient(snapshot)
+    except Exception as e:
+        # the worker reports the error when solving its first family
+        logger.exception("Worker sub-process failed to load the quotient.")
+        load_error = e
 
-        family, optimum = args
-
-        if family is None:
-            pstats.Stats(profile).sort_stats('tottime').print_stats(50)
-            return
 
-        # synchronize optimum
-        if optimum is not None:
-            quotient.specification.optimality.optimum = optimum
+def synchronize_optimum(quotient, optimum):
+    ''' Adopt the global optimum if it is better than the one known to this worker. '''
+    if not quotient.specification.has_optimality:
+        return
+    value = optimum.read()
+    optimality = quotient.specification.optimality
+    if value is not None and optimality.meets_op(value, optimality.optimum):
+        optimality.update_optimum(value)
 
-        quotient.build(family)
-        # self.stat.iteration_mdp(family.mdp.states)
 
-        res = family.mdp.check_specification(quotient.specification, property_indices = family.property_indices, short_evaluation = True)
+def verify_family(quotient, family):
+    '''
+    Analyze the family (in a worker process).
+    :return size of the MDP or None if the family was decided by the bounds
+      of its parent
+    '''
+    res = family.check_parent_bounds(quotient.specification)
+    if res is not None:
+        family.parent_info = None
         family.analysis_result = res
+        return None
+    quotient.build(family)
+    family.parent_info = None
+    family.analysis_result = family.mdp.check_specification(quotient.specification, property_indices = family.property_indices, short_evaluation = True)
+    return family.mdp.states
 
-        improving_assignment,improving_value,can_improve = res.improving(family)
-        # print(res, can_improve)
-        
-        subfamilies = []
-        if can_improve:
-            subfamilies = quotient.split(family, Synthesizer.incomplete_search)
-            # remove parent info since Property is not pickleable
-            for subfamily in subfamilies:
-                subfamily.parent_info = None
 
-        return ([family.mdp.states], improving_value, improving_assignment, subfamilies)
+def explore_subtree(quotient, optimum, compact_family, time_limit):
+    '''
+    Explore the subtree of a family depth-first until the time limit is
+    reached. Subfamilies keep their full parent info as long as they are
+    explored locally, returned families carry its compact summary.
+    :param optimum the global optimum (see SharedOptimum)
+    :return sizes of the analyzed MDPs
+    :return list of improving (value,assignment) pairs, value is None for
+      feasibility problems
+    :return families left unexplored
+    :return number of explored family members
+    '''
+    start_time = time.perf_counter()
 
-    except:
-        logger.error("Worker sub-process encountered an error.")
-        return None
-        
+    mdp_states = []
+    improving = []
+    explored = 0
+    families = [quotient.design_space.from_compact(compact_family, quotient.specification)]
+    while families:
 
+        family = families.pop(-1)
+        synchronize_optimum(quotient, optimum)
+        states = verify_family(quotient, family)
+        if states is not None:
+            mdp_states.append(states)
 
-class SynthesizerMultiCoreAR(SynthesizerAR):
+        improving_assignment,improving_value,can_improve = family.analysis_result.improving(family)
+        if improving_value is not None:
+            quotient.specification.optimality.update_optimum(improving_value)
+            optimum.propose(quotient.specification.optimality, improving_value)
+        if improving_assignment is not None:
+            improving.append( (improving_value, improving_assignment.option_masks) )
 
-    def synthesize_assignment(self, family):
+        if not can_improve:
+            explored += family.size
+        else:
+            families += quotient.split(family, Synthesizer.incomplete_search)
 
-        self.quotient.discarded = 0
+        if time.perf_counter() - start_time >= time_limit:
+            break
 
-        satisfying_assignment = None
-        families = [family]
+    return (mdp_states, improving, [family.to_compact(quotient.specification) for family in families], explored)
 
-        start_time = time.perf_counter()
 
-        global quotient
-        quotient = self.quotient
-        global profile
-        profile = cProfile.Profile()
-        # profile.enable()
-
-        # create a pool of processes
-        # by default, os.cpu_count() processes will be spawned
-        with mp.Pool(
-            # processes = 1
-        ) as pool:
-            
-            while families:
-
-                # get current optimum
-                optimum = None
-                if self.quotient.specification.has_optimality:
-                    optimum = self.quotient.specification.optimality.optimum
-
-                # work with some number of families
-                # print("submitting ", len(families), " families")
-
-                split = os.cpu_count() * 1
-                input_families = families[-split:]
-                input_families_size = sum([family.size for family in input_families])
-                remaining_families = families[:-split]
-
-                inputs = zip(input_families, [optimum] * len(input_families))
-
-                results = pool.map(solve_family, inputs)
-                # results = pool.imap_unordered(solve_family, inputs, chunksize=10)
-                # results = pool.map(solve_batch, inputs)
-
-                # process the results
-                new_families = []
-                for r in results:
-                    if r is None:
-                        logger.error("Worker sub-process encountered an error.")
-                        exit()
-                    mdp_states, improving_value, improving_assignment, subfamilies = r
-                        
-                    for entry in mdp_states:
-                        self.stat.iteration_mdp(entry)
-
-                    if improving_value is not None:
-                        if self.quotient.specification.optimality.improves_optimum(improving_value):
-                            self.quotient.specification.optimality.update_optimum(improving_value)
-                            satisfying_assignment = improving_assignment
-                    
-                    new_families += subfamilies
-
-                new_families_size = sum([family.size for family in new_families])
-                self.explored += input_families_size-new_families_size
-
-                families = remaining_families + new_families
-
-            # pool.apply(solve_family, ((None,None),))
+def solve_subtree(args):
+    '''
+    Explore the subtree of a family (in a pool worker), see explore_subtree.
+    Errors are passed to the coordinator.
+    '''
+    if load_error is not None:
+        raise load_error
+    try:
+        compact_family, time_limit = args
+        return explore_subtree(quotient, shared_optimum, compact_family, time_limit)
+    except:
+        logger.exception("Worker sub-process encountered an error.")
+        raise
 
 
-        finish_time = time.perf_counter()
-        total_time = round(finish_time-start_time, 3)
-        
-        logger.info("Synthesis finished in {} s (real time).".format(total_time))
 
-        # pstats.Stats(profile).sort_stats('tottime').print_stats(10)
+class SynthesizerMultiCoreAR(SynthesizerAR):
+    '''
+    AR distributing families to a pool of persistent workers. Each worker
+    explores the subtree of the family it received for a short time slice
+    and returns the remaining subfamilies. When the frontier runs low, the
+    time slice is dropped such that subfamilies are returned immediately and
+    distributed among idle workers. Workers reconstruct the quotient from a
+    snapshot (see QuotientSnapshot), hence any start method can be used. If
+    the quotient cannot be serialized, worker processes are forked and
+    inherit the quotient of the coordinator.
+    '''
+
+    # time (in seconds) a worker spends in the subtree of a single family
+    local_time = 1
+    # number of worker processes (None for os.cpu_count())
+    num_workers = None
+    # start method of the worker processes (None for the platform default)
+    start_method = None
 
-        return satisfying_assignment
-    
     @property
     def method_name(self):
         return "AR (concurrent)"
 
+    def collect_result(self, result, design_space, families):
+        '''
+        Process the result of a worker (see explore_subtree): update the
+        statistics and the optimum and push the unexplored subfamilies to the
+        frontier.
+        :return the last improving assignment or None
+        '''
+        mdp_states, improving, subfamilies, explored = result
+        specification = self.quotient.specification
 
-def solve_batch(args):
-    '''
-    When an undecidable family is encountered, the subfamilies are processed
-    up to a limit specified below.
-    '''
-
-    try:
-
-        family, optimum = args
+        for entry in mdp_states:
+            self.stat.iteration_mdp(entry)
+        self.explored += explored
 
-        # synchronize optimum
-        if optimum is not None:
-            quotient.specification.optimality.optimum = optimum
+        satisfying_assignment = None
+        for improving_value,improving_assignment in improving:
+            if improving_value is None:
+                satisfying_assignment = design_space.from_compact((improving_assignment, 0, design_space.property_indices, None))
+            elif specification.optimality.improves_optimum(improving_value):
+                specification.optimality.update_optimum(improving_value)
+                satisfying_assignment = design_space.from_compact((improving_assignment, 0, design_space.property_indices, None))
 
-        mdp_states = []
-        improving_value = None
-        improving_assignment = None
-        subfamilies = [family]
+        for subfamily in subfamilies:
+            families.push(design_space.from_compact(subfamily, specification))
+        return satisfying_assignment
 
-        # analyze the batch
-        limit = 1
-        for x in range(limit):
+    def synthesize_assignment(self, family):
 
-            if not subfamilies:
-                break
+        self.quotient.discarded = 0
 
-            family = subfamilies.pop(-1)
-            quotient.build(family)
-            res = family.mdp.check_specification(quotient.specification, property_indices = family.property_indices, short_evaluation = True)
-            family.analysis_result = res
-            mdp_states.append(family.mdp.states)
+        satisfying_assignment = None
+        design_space = family
+        families = make_frontier(SynthesizerAR.frontier_type, design_space)
+        families.push(family)
 
-            improving_assignment,improving_value,can_improve = res.improving(family)
-            
-            if can_improve:
-                subfamilies += quotient.split(family, Synthesizer.incomplete_search)
+        start_time = time.perf_counter()
 
-            if improving_value is not None:
-                break
+        num_workers = SynthesizerMultiCoreAR.num_workers or os.cpu_count()
+        specification = self.quotient.specification
+
+        # results are delivered by the pool callbacks
+        results = queue.Queue()
+        context,quotient_snapshot = prepare_workers(self.quotient, num_workers)
+        pool = None
+        try:
+            optimum = SharedOptimum(self.current_optimum(), context)
+            pool = context.Pool(processes = num_workers, initializer = initialize_worker, initargs = (quotient_snapshot,optimum))
+            in_flight = 0
+            while families or in_flight > 0:
+
+                # keep every worker busy
+                while families and in_flight < num_workers:
+                    family = families.pop()
+                    # when the frontier runs low, return subfamilies immediately
+                    time_limit = SynthesizerMultiCoreAR.local_time if len(families) >= num_workers else 0
+                    pool.apply_async(
+                        solve_subtree, ((family.to_compact(specification), time_limit),),
+                        callback = results.put, error_callback = results.put
+                    )
+                    in_flight += 1
+
+                # process the result of some worker
+                r = results.get()
+                in_flight -= 1
+                if isinstance(r, BaseException):
+                    raise RuntimeError(f"worker sub-process encountered an error: {r!r}") from r
+                satisfying_assignment = self.collect_result(r, design_space, families) or satisfying_assignment
+        finally:
+            if pool is not None:
+                pool.terminate()
+                pool.join()
+            release_workers(quotient_snapshot)
 
-        
-        # remove parent info since Property is not pickleable
-        for subfamily in subfamilies:
-            subfamily.parent_info = None
+        finish_time = time.perf_counter()
+        total_time = round(finish_time-start_time, 3)
 
-        return (mdp_states, improving_value, improving_assignment, subfamilies)
+        logger.info("Synthesis finished in {} s (real time).".format(total_time))
 
-    except:
-        print("meaningful error message")
-        return None
\ No newline at end of file
+        return satisfying_assignment
@@ -501,7 +501,7 @@ class SynthesizerPOMDP:
         for obs in range(num_obs):
             ah = self.quotient.action_hole_prototypes[obs]
             if ah is not None:
-                action_hole_trees[obs] = HoleTree(ah.options)
+                action_hole_trees[obs] = HoleTree(list(ah.options))
             memory_hole_trees[obs] = HoleTree([0])
 
         # start with k=1
@@ -706,13 +706,13 @@ class SynthesizerPOMDP:
                 if len(action_holes) > 0:
                     tree = action_hole_trees[obs]
                     for index,options in enumerate(tree.nodes):
-                        restricted_family[action_holes[index]].assume_options(options)
+                        restricted_family.assume_hole_options(action_holes[index], options)
 
                 memory_holes = self.quotient.observation_memory_holes[obs]
                 if len(memory_holes) > 0:
                     tree = memory_hole_trees[obs]
                     for index,options in enumerate(tree.nodes):
-                        restricted_family[memory_holes[index]].assume_options(options)
+                        restricted_family.assume_hole_options(memory_holes[index], options)
 
             print(restricted_family)
             logger.debug("Symmetry breaking: reduced design space from {} to {}".format(self.quotient.design_space.size, restricted_family.size))
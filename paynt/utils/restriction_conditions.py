@@ -49,18 +49,21 @@ def restrict(self, design_space=None, condition=lambda current, next: current >
     original_size = design_space.size
     options = 0
     removed = 0
-    for hole in design_space:
+    for hole_index,hole in enumerate(design_space):
         assert re.match(
             r"[AM]\(\[.*],\d\)", hole.name), "Cannot use restrict function, hole name doesn't match"
 
         if hole.name[0] == "M":
             current = int(hole.name[-2])
             max = sorted(hole.options)[-2]
-            for option in hole.options.copy():
+            kept_options = []
+            for option in hole.options:
                 options += 1
                 if condition(current, option, max):
-                    hole.options.remove(option)
                     removed += 1
+                else:
+                    kept_options.append(option)
+            design_space.assume_hole_options(hole_index, kept_options)
 
     if design_space.size:
         print("[{}]\tReduced to {}%".format(
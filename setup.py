@@ -74,7 +74,7 @@ setup(
     long_description=
     "PAYNT (Probabilistic progrAm sYNThesizer) is a tool for automated synthesis of probabilistic programs.",
     packages=["paynt", "paynt.sketch", "paynt.synthesizers"],
-    install_requires=['click', 'stormpy', 'z3-solver'],
+    install_requires=['click', 'numpy', 'stormpy', 'z3-solver'],
     extras_require={},
     package_data={
         'paynt': [],
@@ -0,0 +1,127 @@
+import os
+import tempfile
+import types
+import unittest
+
+from paynt.synthesizer.checkpoint import Checkpoint
+from test_utils import PayntTestUtils
+
+"""
+CheckpointTestSuite, which checks that the journal restores the synthesis progress.
+"""
+
+
+class CheckpointTestSuite(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        Checkpoint.path = os.path.join(self.directory.name, "journal")
+        Checkpoint.period = 0
+        Checkpoint.resume = False
+        self.design_space = PayntTestUtils.make_design_space([4, 4, 4])
+        self.design_space.property_indices = []
+
+    def tearDown(self):
+        Checkpoint.path = None
+        Checkpoint.resume = False
+        self.directory.cleanup()
+
+    def synthesizer(self):
+        optimality = types.SimpleNamespace(optimum=None)
+        optimality.update_optimum = lambda value: setattr(optimality, "optimum", value)
+        specification = types.SimpleNamespace(optimality=optimality)
+        return types.SimpleNamespace(explored=0, quotient=types.SimpleNamespace(specification=specification))
+
+    def split(self, checkpoint, family):
+        subfamilies = []
+        for option in family[0].options:
+            subfamily = family.copy()
+            subfamily.assume_hole_options(0, [option])
+            checkpoint.family_pushed(subfamily)
+            subfamilies.append(subfamily)
+        checkpoint.family_done(family, 0)
+        return subfamilies
+
+    def resume(self):
+        Checkpoint.resume = True
+        synthesizer = self.synthesizer()
+        checkpoint = Checkpoint(self.design_space)
+        families,assignment = checkpoint.restore(synthesizer, self.design_space)
+        return checkpoint, synthesizer, families, assignment
+
+    def test_replay(self):
+        checkpoint = Checkpoint(self.design_space)
+        families,_ = checkpoint.restore(self.synthesizer(), self.design_space)
+        subfamilies = self.split(checkpoint, families[0])
+        checkpoint.family_done(subfamilies[1], 16)
+        checkpoint.assignment_found(subfamilies[2].pick_any(), 0.5)
+        checkpoint.close()
+        # a partially written record is discarded
+        with open(Checkpoint.path, "ab") as journal:
+            journal.write(b"\x80\x05garbage")
+
+        checkpoint, synthesizer, families, assignment = self.resume()
+        self.assertTrue(checkpoint.resumed)
+        self.assertEqual(sorted(family[0].options[0] for family in families), [0, 2, 3])
+        self.assertEqual(synthesizer.explored, 16)
+        self.assertEqual(synthesizer.quotient.specification.optimality.optimum, 0.5)
+        self.assertEqual(assignment.option_masks, (0b100, 0b1, 0b1))
+        checkpoint.close()
+
+    def test_compaction(self):
+        checkpoint = Checkpoint(self.design_space)
+        families,_ = checkpoint.restore(self.synthesizer(), self.design_space)
+        # explore many families, the frontier stays small
+        family = families[0]
+        for step in range(1000):
+            subfamilies = self.split(checkpoint, family)
+            for subfamily in subfamilies:
+                checkpoint.family_done(subfamily, step)
+            family = subfamilies[0].copy()
+            checkpoint.family_pushed(family)
+        checkpoint.close()
+        self.assertLess(checkpoint.journal_records, 1000)
+
+        checkpoint, synthesizer, families, _ = self.resume()
+        self.assertEqual([family.option_masks for family in families], [(0b1, 0b1111, 0b1111)])
+        self.assertEqual(synthesizer.explored, 999)
+        checkpoint.close()
+
+    def test_records_during_compaction(self):
+        checkpoint = Checkpoint(self.design_space)
+        families,_ = checkpoint.restore(self.synthesizer(), self.design_space)
+        subfamilies = self.split(checkpoint, families[0])
+        checkpoint.flush()
+        checkpoint.compact()
+        # records appended while the snapshot is written are kept
+        checkpoint.family_done(subfamilies[0], 16)
+        checkpoint.close()
+        self.assertEqual(checkpoint.journal_records, 3)
+
+        checkpoint, synthesizer, families, _ = self.resume()
+        self.assertEqual(sorted(family[0].options[0] for family in families), [1, 2, 3])
+        self.assertEqual(synthesizer.explored, 16)
+        checkpoint.close()
+
+    def test_different_design_space(self):
+        checkpoint = Checkpoint(self.design_space)
+        checkpoint.restore(self.synthesizer(), self.design_space)
+        checkpoint.close()
+        Checkpoint.resume = True
+        other = self.design_space.copy()
+        other.assume_hole_options(0, [0, 1])
+        with self.assertRaises(ValueError):
+            Checkpoint(other)
+
+    def test_disabled(self):
+        Checkpoint.path = None
+        checkpoint = Checkpoint(self.design_space)
+        self.assertFalse(checkpoint.enabled)
+        # the family is not inspected at all
+        checkpoint.family_pushed(None)
+        checkpoint.family_done(None, 0)
+        checkpoint.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+import types
+import unittest
+
+from paynt.quotient.coloring import MdpColoring
+from paynt.quotient.holes import Hole, Holes
+
+"""
+ColoringTestSuite, which checks the flat labeling of the quotient choices.
+"""
+
+
+def make_coloring():
+    # 2 states, choices 0-2 in state 0 and choices 3-4 in state 1
+    mdp = types.SimpleNamespace(nr_choices=5, nr_states=2, nondeterministic_choice_indices=[0, 3, 5])
+    holes = Holes([Hole("x", [0, 1], ["0", "1"]), Hole("y", [0, 1, 2], ["0", "1", "2"])])
+    action_to_hole_options = [{0: 0}, {0: 1, 1: 0}, {}, {1: 1}, {1: 2}]
+    return MdpColoring(mdp, holes, action_to_hole_options)
+
+
+class ColoringTestSuite(unittest.TestCase):
+
+    def test_flat_labels(self):
+        coloring = make_coloring()
+        self.assertEqual(coloring.label_choice.tolist(), [0, 1, 1, 3, 4])
+        self.assertEqual(coloring.label_hole.tolist(), [0, 0, 1, 1, 1])
+        self.assertEqual(coloring.label_option.tolist(), [0, 1, 0, 1, 2])
+        self.assertEqual(coloring.choice_label_offsets.tolist(), [0, 1, 3, 3, 4, 5])
+        self.assertEqual(coloring.state_to_holes, [{0, 1}, {1}])
+        self.assertFalse(coloring.coloring_is_simple)
+
+    def test_choice_labels(self):
+        coloring = make_coloring()
+        labels, counts = coloring.choice_labels([4, 1, 2])
+        self.assertEqual(labels.tolist(), [4, 1, 2])
+        self.assertEqual(counts.tolist(), [1, 2, 0])
+
+    def test_labels_from_flat_arrays(self):
+        coloring = make_coloring()
+        labels = (coloring.label_choice, coloring.label_hole, coloring.label_option)
+        copy = MdpColoring(coloring.mdp, coloring.holes, labels = labels)
+        self.assertEqual(copy.choice_label_offsets.tolist(), coloring.choice_label_offsets.tolist())
+        self.assertEqual(copy.hole_option_to_actions, coloring.hole_option_to_actions)
+
+    def test_count_states_per_hole(self):
+        coloring = make_coloring()
+        self.assertEqual(coloring.count_states_per_hole([0, 1]).tolist(), [1, 2])
+        self.assertEqual(coloring.count_states_per_hole([1]).tolist(), [0, 1])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,158 @@
+import itertools
+import random
+import unittest
+
+from paynt.quotient.enumerator import CubeEnumerator
+from test_utils import PayntTestUtils
+
+"""
+EnumeratorTestSuite, which checks the enumeration of non-excluded assignments
+by the native cube enumerator and its subsumption queries against a
+brute-force enumeration.
+"""
+
+
+def is_excluded(assignment, cubes):
+    return any(all(cube[hole_index] >> option & 1 for hole_index,option in enumerate(assignment)) for cube in cubes)
+
+
+def free_members(family, cubes):
+    members = itertools.product(*[hole.options for hole in family])
+    return [member for member in members if not is_excluded(member, cubes)]
+
+
+class EnumeratorTestSuite(unittest.TestCase):
+
+    def test_pick_and_exclude(self):
+        family = PayntTestUtils.make_design_space([2, 3])
+        enumerator = CubeEnumerator(family)
+        excluded = []
+        while True:
+            assignment = enumerator.pick_assignment(family)
+            if assignment is None:
+                break
+            self.assertNotIn(assignment, excluded)
+            excluded.append(assignment)
+            enumerator.exclude([1 << option for option in assignment])
+        self.assertEqual(len(excluded), family.size)
+
+    def test_exclude_cube(self):
+        family = PayntTestUtils.make_design_space([2, 3])
+        enumerator = CubeEnumerator(family)
+        # exclude all assignments with h0=0 as well as h1 in {1,2}
+        enumerator.exclude([0b01, 0b111])
+        enumerator.exclude([0b11, 0b110])
+        self.assertEqual(enumerator.pick_assignment(family), [1, 0])
+        enumerator.exclude([0b10, 0b001])
+        self.assertIsNone(enumerator.pick_assignment(family))
+
+    def test_subfamily(self):
+        family = PayntTestUtils.make_design_space([3, 3])
+        enumerator = CubeEnumerator(family)
+        enumerator.exclude([0b001, 0b111])
+        subfamily = family.copy()
+        subfamily.assume_hole_options(0, [0])
+        self.assertIsNone(enumerator.pick_assignment(subfamily))
+        subfamily = family.copy()
+        subfamily.assume_hole_options(0, [0, 2])
+        self.assertEqual(enumerator.pick_assignment(subfamily)[0], 2)
+
+    def test_push_pop(self):
+        family = PayntTestUtils.make_design_space([2, 2])
+        enumerator = CubeEnumerator(family)
+        enumerator.exclude([0b01, 0b11])
+        enumerator.push()
+        enumerator.exclude([0b10, 0b11])
+        self.assertIsNone(enumerator.pick_assignment(family))
+        self.assertEqual(enumerator.scope_cubes(), [[[0b01, 0b11]], [[0b10, 0b11]]])
+        enumerator.pop()
+        self.assertEqual(enumerator.pick_assignment(family)[0], 1)
+        self.assertEqual(enumerator.scope_cubes(), [[[0b01, 0b11]]])
+
+    def test_random(self):
+        rng = random.Random(5)
+        for trial in range(200):
+            family = PayntTestUtils.make_design_space([rng.randint(1,4) for hole in range(rng.randint(1,5))])
+            enumerator = CubeEnumerator(family)
+            scopes = [[]]
+            for step in range(30):
+                r = rng.random()
+                if r < 0.1:
+                    enumerator.push()
+                    scopes.append([])
+                elif r < 0.2 and len(scopes) > 1:
+                    enumerator.pop()
+                    scopes.pop()
+                else:
+                    cube = [rng.randint(1, (1 << len(hole.option_labels)) - 1) for hole in family]
+                    enumerator.exclude(cube)
+                    scopes[-1].append(cube)
+                subfamily = family.copy()
+                for hole_index,hole in enumerate(subfamily):
+                    subfamily.assume_hole_options(hole_index, rng.sample(hole.options, rng.randint(1,hole.size)))
+                assignment = enumerator.pick_assignment(subfamily)
+                free = free_members(subfamily, [cube for scope in scopes for cube in scope])
+                if assignment is None:
+                    self.assertEqual(free, [])
+                else:
+                    self.assertIn(tuple(assignment), free)
+
+    def test_subsumption(self):
+        family = PayntTestUtils.make_design_space([3, 3])
+        enumerator = CubeEnumerator(family)
+        enumerator.exclude([0b011, 0b001])
+        enumerator.push()
+        enumerator.exclude([0b001, 0b011])
+        # a stored cube includes the conflict
+        self.assertEqual(enumerator.including_cubes([0b001, 0b001]), 0b11)
+        self.assertEqual(enumerator.including_cubes([0b010, 0b001]), 0b01)
+        self.assertEqual(enumerator.including_cubes([0b100, 0b001]), 0)
+        # only cubes of the innermost scope are reported as included
+        self.assertEqual(enumerator.included_cubes([0b111, 0b111]), 0b10)
+        enumerator.remove(0b10)
+        self.assertEqual(enumerator.scope_cubes(), [[[0b011, 0b001]], []])
+        self.assertEqual(enumerator.including_cubes([0b001, 0b010]), 0)
+        self.assertEqual(enumerator.pick_assignment(family), [0, 1])
+        enumerator.pop()
+        self.assertEqual(enumerator.scope_cubes(), [[[0b011, 0b001]]])
+
+    def test_random_subsumption(self):
+        rng = random.Random(3)
+
+        def includes(cube, other):
+            return all(mask & other_mask == other_mask for mask,other_mask in zip(cube, other))
+
+        for trial in range(200):
+            family = PayntTestUtils.make_design_space([rng.randint(1,4) for hole in range(rng.randint(1,4))])
+            enumerator = CubeEnumerator(family)
+            scopes = [[]]
+            for step in range(30):
+                r = rng.random()
+                if r < 0.1:
+                    enumerator.push()
+                    scopes.append([])
+                    continue
+                if r < 0.2 and len(scopes) > 1:
+                    enumerator.pop()
+                    scopes.pop()
+                    continue
+                cube = [rng.randint(1, (1 << len(hole.option_labels)) - 1) for hole in family]
+                # drop redundant conflicts, remove subsumed ones (as the conflict store of SmtSolver)
+                including = [stored for scope in scopes for stored in scope if includes(stored, cube)]
+                self.assertEqual(bin(enumerator.including_cubes(cube)).count("1"), len(including))
+                if including:
+                    continue
+                included = [stored for stored in scopes[-1] if includes(cube, stored)]
+                subsumed = enumerator.included_cubes(cube)
+                self.assertEqual(bin(subsumed).count("1"), len(included))
+                enumerator.remove(subsumed)
+                enumerator.exclude(cube)
+                scopes[-1] = [stored for stored in scopes[-1] if not includes(cube, stored)] + [cube]
+                self.assertEqual(enumerator.scope_cubes(), scopes)
+                assignment = enumerator.pick_assignment(family)
+                free = free_members(family, [stored for scope in scopes for stored in scope])
+                self.assertEqual(assignment is None, free == [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,122 @@
+import math
+import random
+import types
+import unittest
+
+from paynt.synthesizer.frontier import StackFrontier, QueueFrontier, HeapFrontier, HybridFrontier, SpillingFrontier, make_frontier
+from paynt.synthesizer.synthesizer_ar import SynthesizerAR
+from test_utils import PayntTestUtils
+
+"""
+FrontierTestSuite, which checks the order in which pending families are explored.
+"""
+
+
+class FrontierTestSuite(unittest.TestCase):
+
+    def setUp(self):
+        # a design space with a single hole of 16 options, family i contains option i
+        self.design_space = PayntTestUtils.make_design_space([16])
+
+    def family(self, option):
+        family = self.design_space.copy()
+        family.assume_hole_options(0, [option])
+        return family
+
+    def explore(self, frontier):
+        options = []
+        while frontier:
+            options.append(frontier.pop()[0].options[0])
+        return options
+
+    def test_stack(self):
+        frontier = StackFrontier()
+        for option in range(4):
+            frontier.push(self.family(option))
+        self.assertEqual(self.explore(frontier), [3, 2, 1, 0])
+
+    def test_queue(self):
+        frontier = QueueFrontier()
+        for option in range(4):
+            frontier.push(self.family(option))
+        self.assertEqual(self.explore(frontier), [0, 1, 2, 3])
+
+    def test_heap(self):
+        frontier = HeapFrontier()
+        frontier.push_all([self.family(option) for option in range(5)], [1, 3, 2, 3, 0])
+        # ties are broken in favour of recently pushed families
+        self.assertEqual(self.explore(frontier), [3, 1, 2, 0, 4])
+
+    def test_hybrid(self):
+        dive_depth = HybridFrontier.dive_depth
+        HybridFrontier.dive_depth = 1
+        try:
+            frontier = HybridFrontier()
+            frontier.push_all([self.family(option) for option in range(3)], [2, 0, 1])
+            # one dive step, then the remaining families go to the heap
+            self.assertEqual(self.explore(frontier), [2, 0, 1])
+        finally:
+            HybridFrontier.dive_depth = dive_depth
+
+    def test_make_frontier(self):
+        self.assertIsInstance(make_frontier("dfs", self.design_space), StackFrontier)
+        self.assertIsInstance(make_frontier("best", self.design_space), HeapFrontier)
+        with self.assertRaises(ValueError):
+            make_frontier("unknown", self.design_space)
+
+    def check_spilling(self, lifo):
+        window_size = SpillingFrontier.window_size
+        SpillingFrontier.window_size = 3
+        try:
+            spilling = SpillingFrontier(self.design_space, lifo)
+            reference = StackFrontier() if lifo else QueueFrontier()
+            generator = random.Random(1)
+            popped,expected = [],[]
+            for step in range(200):
+                if reference and generator.random() < 0.4:
+                    popped.append(spilling.pop()[0].options[0])
+                    expected.append(reference.pop()[0].options[0])
+                else:
+                    option = generator.randrange(16)
+                    spilling.push(self.family(option))
+                    reference.push(self.family(option))
+                self.assertEqual(len(spilling), len(reference))
+            popped += self.explore(spilling)
+            expected += self.explore(reference)
+            self.assertEqual(popped, expected)
+            self.assertGreater(spilling.spilled, 0)
+        finally:
+            SpillingFrontier.window_size = window_size
+
+    def test_spilling_dfs(self):
+        self.check_spilling(True)
+
+    def test_spilling_bfs(self):
+        self.check_spilling(False)
+
+    def analyzed_parent(self, primary, secondary = None, threshold = 0.5):
+        ''' Stand-in for a parent family whose undecided (minimizing) property has the given bounds. '''
+        prop = types.SimpleNamespace(threshold=threshold)
+        result = types.SimpleNamespace(
+            minimizing=True, primary=types.SimpleNamespace(prop=prop, value=primary),
+            bounds=lambda: (primary, secondary))
+        return types.SimpleNamespace(analysis_result=types.SimpleNamespace(undecided_result=lambda: result))
+
+    def test_gap_priority(self):
+        synthesizer = SynthesizerAR.__new__(SynthesizerAR)
+        SynthesizerAR.frontier_key = "gap"
+        try:
+            family = self.family(0)
+            # secondary direction computed: the width of the bounds
+            self.assertAlmostEqual(synthesizer.family_priority(family, self.analyzed_parent(0.1, 0.4)), 0.3)
+            # otherwise, the distance of the primary bound from the threshold
+            self.assertAlmostEqual(synthesizer.family_priority(family, self.analyzed_parent(0.1)), 0.4)
+            self.assertAlmostEqual(synthesizer.family_priority(family, self.analyzed_parent(0.3)), 0.2)
+            # without an optimum, the value of the parent
+            self.assertAlmostEqual(synthesizer.family_priority(family, self.analyzed_parent(0.3, threshold=math.inf)), -0.3)
+        finally:
+            SynthesizerAR.frontier_key = "value"
+
+
+if __name__ == '__main__':
+    unittest.main()
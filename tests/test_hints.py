@@ -0,0 +1,74 @@
+import os
+import tempfile
+import types
+import unittest
+
+import stormpy
+import stormpy.synthesis
+
+from paynt.quotient.models import MarkovChain, MDP
+
+"""
+HintsTestSuite, which checks that MDP model checking warm-started with a hint
+(a lower bound on the values, as inherited from the parent family) yields the
+same values as model checking without a hint.
+"""
+
+
+PROGRAM = """
+mdp
+module m
+    s : [0..3] init 0;
+    [a] s=0 -> 0.5:(s'=1) + 0.5:(s'=2);
+    [b] s=0 -> 0.2:(s'=3) + 0.8:(s'=0);
+    [c] s=1 -> 0.7:(s'=3) + 0.3:(s'=0);
+    [d] s=1 -> 1:(s'=2);
+    [] s=2 -> 1:(s'=2);
+    [] s=3 -> 1:(s'=3);
+endmodule
+label "goal" = s=3;
+rewards
+    true : 1;
+endrewards
+"""
+
+FORMULAE = ['Pmin=? [F "goal"]', 'Pmax=? [F "goal"]', 'Rmin=? [F "goal"]']
+
+
+class HintsTestSuite(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        handle,path = tempfile.mkstemp(suffix=".prism")
+        with os.fdopen(handle, "w") as f:
+            f.write(PROGRAM)
+        program = stormpy.parse_prism_program(path)
+        os.remove(path)
+        cls.formulae = [prop.raw_formula for prop in stormpy.parse_properties_for_prism_program(";".join(FORMULAE), program)]
+        MarkovChain.initialize(types.SimpleNamespace(stormpy_formulae=lambda: cls.formulae))
+        options = stormpy.BuilderOptions(cls.formulae)
+        options.set_build_choice_labels(True)
+        cls.mdp = MDP.__new__(MDP)
+        cls.mdp.model = stormpy.build_sparse_model_with_options(program, options)
+
+    def assert_same_values(self, result, expected):
+        for state in range(self.mdp.states):
+            value,expected_value = result.at(state), expected.at(state)
+            if expected_value == float("inf"):
+                self.assertEqual(value, expected_value)
+            else:
+                self.assertAlmostEqual(value, expected_value, delta=1e-3)
+
+    def test_hint_matches_cold_start(self):
+        for formula in self.formulae:
+            cold = self.mdp.model_check_formula(formula)
+            values = [cold.at(state) for state in range(self.mdp.states)]
+            # lower bounds below the values, as the hints of a parent family
+            zero = [0.0] * len(values)
+            half = [value / 2 if value != float("inf") else 0.0 for value in values]
+            for hint in [zero, half]:
+                self.assert_same_values(self.mdp.model_check_formula_hint(formula, hint), cold)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,126 @@
+import pickle
+import types
+import unittest
+
+import numpy
+
+from paynt.quotient.holes import Hole, Holes, DesignSpace, ParentInfo
+from test_utils import PayntTestUtils
+
+"""
+HolesTestSuite, which checks the bitmask representation of hole options.
+"""
+
+
+class MinimizingProperty:
+    ''' Stand-in for a property whose parent bounds decide (or not) its subfamilies. '''
+    minimizing = True
+
+    def __init__(self, decision = None):
+        self.decision = decision
+
+    def decide_bounds(self, primary, secondary):
+        return self.decision
+
+
+class HolesTestSuite(unittest.TestCase):
+
+    def test_options_and_mask(self):
+        hole = Hole("h", [0, 2, 3], ["a", "b", "c", "d"])
+        self.assertEqual(hole.mask, 0b1101)
+        self.assertEqual(hole.options, (0, 2, 3))
+        self.assertEqual(hole.size, 3)
+        self.assertTrue(hole.includes_option(2))
+        self.assertFalse(hole.includes_option(1))
+        self.assertFalse(hole.is_unrefined)
+
+    def test_mask_restriction(self):
+        hole = Hole("h", [0, 1, 2, 3], ["a", "b", "c", "d"])
+        self.assertTrue(hole.is_unrefined)
+        hole.intersect_mask(0b0110)
+        self.assertEqual(hole.options, (1, 2))
+        hole.assume_mask(0b1000)
+        self.assertTrue(hole.is_trivial)
+        self.assertEqual(str(hole), "h=d")
+
+    def test_options_are_not_shared_mutably(self):
+        hole = Hole("h", [0, 1, 2], ["a", "b", "c"])
+        copy = hole.copy()
+        self.assertIsInstance(copy.options, tuple)
+        copy.assume_options([1])
+        self.assertEqual(hole.options, (0, 1, 2))
+        self.assertEqual(copy.options, (1,))
+
+    def test_family_copy_on_write(self):
+        family = DesignSpace(PayntTestUtils.make_holes([3, 2, 4]))
+        subfamily = family.copy()
+        subfamily.assume_hole_options(0, [1])
+        self.assertEqual(family[0].options, (0, 1, 2))
+        self.assertEqual(subfamily.option_masks, (0b010, 0b11, 0b1111))
+        self.assertEqual(family.size, 24)
+        self.assertEqual(subfamily.size, 8)
+
+    def make_bounded_family(self, optimum_improvable):
+        # minimizing optimality property whose parent value was 0.5
+        optimality = MinimizingProperty(None if optimum_improvable else False)
+        constraint = MinimizingProperty()
+        specification = types.SimpleNamespace(constraints=[constraint], has_optimality=True, optimality=optimality)
+        parent_info = ParentInfo()
+        parent_info.refinement_depth = 0
+        parent_info.property_indices = [0]
+        parent_info.property_bounds = {optimality: (0.5, 0.7)}
+        family = DesignSpace(PayntTestUtils.make_holes([2]), parent_info)
+        return family, specification
+
+    def test_parent_bounds_undecided(self):
+        family, specification = self.make_bounded_family(True)
+        self.assertIsNone(family.check_parent_bounds(specification))
+
+    def test_parent_bounds_cannot_improve(self):
+        family, specification = self.make_bounded_family(False)
+        result = family.check_parent_bounds(specification)
+        # constraints were not checked, so their feasibility is not claimed
+        self.assertIsNone(result.constraints_result.feasibility)
+        self.assertEqual(result.constraints_result.undecided_constraints, [0])
+        self.assertEqual(result.improving(family), (None, None, False))
+
+    def test_compact_round_trip(self):
+        constraint = MinimizingProperty()
+        optimality = MinimizingProperty()
+        specification = types.SimpleNamespace(all_properties=lambda: [constraint, optimality])
+        parent_info = ParentInfo()
+        parent_info.refinement_depth = 1
+        parent_info.property_indices = [0]
+        parent_info.splitter = 1
+        parent_info.property_bounds = {optimality: (0.25, 0.75)}
+        parent_info.hint_states = numpy.array([0, 3, 7], dtype=numpy.int64)
+        hint = numpy.array([0.1, 1/3, 2.0])
+        parent_info.analysis_hints = {constraint: hint}
+        family = DesignSpace(PayntTestUtils.make_holes([3, 4]), parent_info)
+        family.assume_hole_options(1, [0, 2])
+        family.refinement_depth = 2
+        family.property_indices = [0]
+
+        compact = pickle.loads(pickle.dumps(family.to_compact(specification)))
+        restored = DesignSpace(PayntTestUtils.make_holes([3, 4])).from_compact(compact, specification)
+        self.assertEqual(restored.option_masks, family.option_masks)
+        self.assertEqual(restored.refinement_depth, 2)
+        self.assertEqual(restored.property_indices, [0])
+        restored_info = restored.parent_info
+        self.assertEqual((restored_info.refinement_depth, restored_info.property_indices, restored_info.splitter), (1, [0], 1))
+        self.assertEqual(restored_info.property_bounds, {optimality: (0.25, 0.75)})
+        self.assertEqual(restored_info.hint_states.tolist(), [0, 3, 7])
+        # single-precision hints remain lower bounds
+        restored_hint = restored_info.analysis_hints[constraint]
+        self.assertEqual(restored_hint.dtype, numpy.float32)
+        self.assertTrue(numpy.all(restored_hint <= hint))
+        self.assertTrue(numpy.allclose(restored_hint, hint))
+
+        # without the specification, the parent info is dropped
+        compact = family.to_compact()
+        self.assertIsNone(compact[3])
+        self.assertIsNone(DesignSpace(PayntTestUtils.make_holes([3, 4])).from_compact(compact).parent_info)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,52 @@
+import types
+import unittest
+
+from paynt.quotient.quotient import ModelCache
+
+"""
+ModelCacheTestSuite, which checks the LRU cache of restricted quotient models.
+"""
+
+
+def make_entry(nr_transitions):
+    model = types.SimpleNamespace(nr_transitions=nr_transitions, nr_choices=0)
+    return (model, [], [])
+
+
+class ModelCacheTestSuite(unittest.TestCase):
+
+    def test_disabled(self):
+        cache = ModelCache(0)
+        cache.put("a", make_entry(1))
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.hits + cache.misses, 0)
+
+    def test_hits_and_misses(self):
+        cache = ModelCache(1000)
+        entry = make_entry(1)
+        self.assertIsNone(cache.get("a"))
+        cache.put("a", entry)
+        self.assertIs(cache.get("a"), entry)
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+    def test_eviction_of_least_recently_used(self):
+        # each entry occupies 16 B
+        cache = ModelCache(32)
+        cache.put("a", make_entry(1))
+        cache.put("b", make_entry(1))
+        cache.get("a")
+        cache.put("c", make_entry(1))
+        self.assertIsNotNone(cache.get("a"))
+        self.assertIsNone(cache.get("b"))
+        self.assertIsNotNone(cache.get("c"))
+        self.assertEqual(cache.size, 32)
+
+    def test_oversized_entry(self):
+        cache = ModelCache(10)
+        cache.put("a", make_entry(1))
+        self.assertIsNone(cache.get("a"))
+        self.assertEqual(cache.size, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -4,6 +4,8 @@
 """
 import os
 
+from paynt.quotient.holes import Hole, Holes, DesignSpace
+
 """
 PayntUtils class, which provides auxiliary methods for the tests
 """
@@ -22,3 +24,12 @@ class PayntTestUtils:
         assert "workspace" in os.listdir(PayntTestUtils.ROOT_DIR)
         assert "examples" in os.listdir(PayntTestUtils.ROOT_DIR + "/workspace")
         return PayntTestUtils.ROOT_DIR + "/workspace/examples"
+
+    @staticmethod
+    def make_holes(sizes):
+        ''' Holes h0, h1, ... having the given numbers of options labeled by their indices. '''
+        return Holes([Hole(f"h{index}", list(range(size)), [str(option) for option in range(size)]) for index,size in enumerate(sizes)])
+
+    @staticmethod
+    def make_design_space(sizes):
+        return DesignSpace(PayntTestUtils.make_holes(sizes))